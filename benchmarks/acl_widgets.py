@@ -0,0 +1,177 @@
+'''
+Compare building ACL widgets from the normalised working list against the per-row approach it replaced.
+
+Usage: python benchmarks/acl_widgets.py [rows] [distinct requests]
+
+A working list of rows ACL requests (default 1,000), drawn from the given number of distinct
+requests (default 50), is generated in the shape create_working_list_and_archive_dataframe
+writes it. The widget XML from both approaches must agree.
+'''
+import random
+import sys
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from lxml import etree as et
+
+from sitebuilder_interaction_tasks.AutomatedContentListings import AutomatedContentListings
+from sitebuilder_interaction_tasks.ModifyFile import ModifyFile
+
+ROUNDS = 5
+
+
+def working_list(rows, distinct):
+    random.seed(0)
+
+    requests = []
+    for i in range(distinct):
+        mode = random.choice(['MostRecent', 'MostRead', 'MostCited', 'Search'])
+        requests.append({
+            'url_shortcode': f'journal{i % 20}',
+            'instance_name': f'acl_widget_{i}',
+            'Mode': mode,
+            'CombinedModeList': random.choice([np.nan, np.nan, 'MostRead,MostCited']),
+            'AdvancedQuery': random.choice([np.nan, 'keywords:(&quot;cancer&quot; &amp; cells)', 'subject:Oncology']),
+            'Title.Text': random.choice(['Latest articles', 'Most read', np.nan]),
+            'Title.Enabled': random.choice([True, False]),
+            'JournalNameEnabled': random.choice([True, False]),
+            'AuthorsEnabled': random.choice([True, False]),
+            'TeaserTextEnabled': random.choice(['TRUE', 'false', True]),
+            'TeaserTextMaxCharacterLength': random.choice([0, 200]),
+            'NumberOfResults': random.choice([5, 10]),
+            'ArticleListPageSize': random.choice([0, 10]),
+            'NumYearsOfCitations': random.choice([0, 2]),
+            'SortOrder': random.choice([np.nan, 1.0, 2.0]),
+            'UserEmail': 'someone@example.com',
+            'TimeRequested': '01/01/2020 09:00',
+        })
+
+    return pd.DataFrame([requests[random.randrange(distinct)] for i in range(rows)])
+
+
+def magic_widget(d, instance_name):
+    widget_block = et.Element('Widget', attrib={'type':'SelectableContentList', 'instanceName':instance_name})
+    widget_settings = et.Element('WidgetSetting', attrib={'type':'SelectableContentList',
+                                                          'instanceName':instance_name,
+                                                          'controllerName':'Solr'})
+    for k, v in d.items():
+        if pd.isnull(v):
+            continue
+        if k in ('Mode', 'ArticleListPageSize', 'NumYearsOfCitations'):
+            continue
+        k = str(k)
+        v = str(v)
+        if v in ('TRUE', 'FALSE', 'true', 'false'):
+            v = v.title()
+        if '&quot;' in v or '&amp;' in v:
+            v = v.replace('&quot;', '"').replace('&amp;', '&')
+        et.SubElement(widget_settings, 'Setting', attrib={'name':k, 'value':v, 'type':"RuntimeSetting"})
+
+    et.SubElement(widget_settings, 'Setting', attrib={'name':'ShowBasicView', 'value':'True', 'type':"RuntimeSetting"})
+    et.SubElement(widget_settings, 'Setting', attrib={'name':'VerticalListOrientation', 'value':'True', 'type':"RuntimeSetting"})
+    et.SubElement(widget_settings, 'Setting', attrib={'name':'BrowseAllEnable', 'value':'False', 'type':"RuntimeSetting"})
+
+    return widget_block, widget_settings
+
+
+def alnp_widget(d, instance_name):
+    if d['CombinedModeList'] != None:
+        controller_name = 'OUPCache'
+        action_name = 'ArticleListNewAndPopularCombinedView'
+    else:
+        controller_name = 'Article'
+        action_name = 'ArticleListNewAndPopularByMode'
+
+    widget_block = et.Element('Widget', attrib={'type':'ArticleListNewAndPopular', 'instanceName':instance_name})
+    widget_settings = et.Element('WidgetSetting', attrib={'type':'ArticleListNewAndPopular',
+                                                          'instanceName':instance_name,
+                                                          'controllerName':controller_name,
+                                                          'actionName': action_name})
+    for k, v in d.items():
+        if pd.isnull(v):
+            continue
+        elif v in ('FALSE', 'False', 'false', False):
+            continue
+        k = str(k)
+        v = str(v)
+        if v in ('TRUE', 'FALSE', 'true', 'false'):
+            v = v.title()
+        if '&quot;' in v or '&amp;' in v:
+            v = v.replace('&quot;', '"').replace('&amp;', '&')
+        et.SubElement(widget_settings, 'Setting', attrib={'name':k, 'value':v, 'type':"RuntimeSetting"})
+
+    return widget_block, widget_settings
+
+
+def per_row_widgets(df):
+    '''
+    The widgets previously built by ModifyFile.modify_xml for each row of the working list.
+    '''
+    widgets = []
+
+    for d in df.replace([np.nan], [None]).to_dict('records'):
+        for k in ('url_shortcode', 'UserEmail', 'TimeRequested'):
+            d.pop(k, None)
+        instance_name = d.pop('instance_name')
+
+        try:
+            if d['Mode'] in ('MostRead', 'MostCited') or d['CombinedModeList'] is not None:
+                widgets.append(alnp_widget(d, instance_name))
+            else:
+                widgets.append(magic_widget(d, instance_name))
+        except Exception:
+            widgets.append(magic_widget(d, instance_name))
+
+    return widgets
+
+
+def normalised_widgets(df):
+    ModifyFile.widget_cache.clear()
+
+    working_list = AutomatedContentListings.working_list_requests(df)
+
+    # Rows come back grouped by url_shortcode, so pair them up with the rows in df in that order
+    requests = [request for url_shortcode in df['url_shortcode'].unique() for request in working_list[url_shortcode]]
+
+    return [ModifyFile.acl_widget(request) for request in requests], df['url_shortcode'].unique()
+
+
+def serialise(widgets):
+    return [et.tostring(block) + et.tostring(settings) for block, settings in widgets]
+
+
+def main(args):
+    rows = int(args[0]) if len(args) > 0 else 1000
+    distinct = int(args[1]) if len(args) > 1 else 50
+
+    df = working_list(rows, distinct)
+
+    # Compare in the grouped order that the normalised working list uses
+    grouped = pd.concat([df[df['url_shortcode'] == x] for x in df['url_shortcode'].unique()])
+    actual, _ = normalised_widgets(df)
+
+    if serialise(per_row_widgets(grouped)) != serialise(actual):
+        print("Widget XML differs between the two approaches")
+        return 1
+
+    def best(f):
+        times = []
+        for i in range(ROUNDS):
+            start = perf_counter()
+            f()
+            times.append(perf_counter() - start)
+        return min(times)
+
+    per_row_time = best(lambda: per_row_widgets(df))
+    normalised_time = best(lambda: normalised_widgets(df))
+
+    print(f"{rows} rows from {distinct} distinct requests: "
+          f"per row {per_row_time * 1000:.1f} ms, normalised {normalised_time * 1000:.1f} ms, "
+          f"{per_row_time / normalised_time:.1f}x faster")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,88 @@
+'''
+Compare LinkExtractor against the BeautifulSoup "html.parser" approach it replaced.
+
+Usage: python benchmarks/link_extraction.py [saved edit-site pages...]
+
+With no arguments the sample page in benchmarks/sample_pages is used. Save real edit-site
+pages from a browser to check them too; the link maps from both approaches must agree.
+'''
+import re
+import sys
+from glob import glob
+from os.path import basename, dirname, join
+from timeit import repeat
+
+from bs4 import BeautifulSoup as bs
+
+from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
+from sitebuilder_interaction_tasks.LinkExtractor import LinkExtractor
+
+JOURNAL_SHORTCODE = "sample"
+ROUNDS = 5
+NUMBER = 20
+
+
+def soup_site_links(content, journal_shortcode):
+    '''
+    The link lookups previously done in get_data, post_xml and publish_to_live.
+    '''
+    soup = bs(content, 'html.parser')
+    site_links = {'download': {}, 'upload': {}, 'publish': None}
+
+    download_buttons = soup.find_all(attrs={"class": "btn-action"}, text="Download")
+    upload_buttons = soup.find_all("input", attrs={"class": "btn-action btn-primary"})
+
+    for file_extension in SitebuilderSite.file_type_sb_url_conversion:
+        file_name = f"{journal_shortcode}_{file_extension}"
+
+        for x in download_buttons:
+            href = x.get("href")
+
+            if file_extension == "data.xml":
+                if re.findall(re.compile(r"SiteDataCore&workflowSubType=$"), href):
+                    site_links['download'][file_extension] = href
+            elif file_extension != "config.xml":
+                if SitebuilderSite.file_type_sb_url_conversion[file_extension] in href:
+                    site_links['download'][file_extension] = href
+            elif all(y in href for y in ['Live', 'SiteCore']):
+                site_links['download'][file_extension] = href
+
+        for x in upload_buttons:
+            if file_name in x.get("data-url"):
+                site_links['upload'][file_name] = x.get("data-url")
+
+    for x in soup.find_all(class_='btn-warning is-active'):
+        site_links['publish'] = x.get('data-url')
+
+    return site_links
+
+
+def main(paths):
+    if not paths:
+        paths = sorted(glob(join(dirname(__file__), "sample_pages", "*.html")))
+
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+
+        expected = soup_site_links(content, JOURNAL_SHORTCODE)
+        actual = LinkExtractor.extract_site_links(content, JOURNAL_SHORTCODE)
+
+        if actual != expected:
+            print(f"{basename(path)}: link maps differ\n  soup: {expected}\n  lxml: {actual}")
+            return 1
+
+        soup_time = min(repeat(lambda: soup_site_links(content, JOURNAL_SHORTCODE),
+                               repeat=ROUNDS, number=NUMBER)) / NUMBER
+        lxml_time = min(repeat(lambda: LinkExtractor.extract_site_links(content, JOURNAL_SHORTCODE),
+                               repeat=ROUNDS, number=NUMBER)) / NUMBER
+
+        print(f"{basename(path)} ({len(content)} bytes): "
+              f"soup {soup_time * 1000:.2f} ms, lxml {lxml_time * 1000:.2f} ms, "
+              f"{soup_time / lxml_time:.1f}x faster")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
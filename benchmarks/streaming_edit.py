@@ -0,0 +1,88 @@
+'''
+Check that streamed edits (--stream-threshold) write the same file as the same edits made to the
+whole document, and that making them again to their own output is reported as no change.
+
+Usage: python benchmarks/streaming_edit.py
+
+The IF and PPV updates are made to the sample data files, including one whose first ImpactFactors
+element is empty and whose current impact factor is in a later one, and the rankings update to
+the sample rankings file.
+'''
+import sys
+from os.path import dirname, join
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+
+from sitebuilder_interaction_tasks.FileToUpdate import FileToUpdate
+from sitebuilder_interaction_tasks.ModifyFile import ModifyFile
+from sitebuilder_interaction_tasks.SiteDocument import SiteDocument
+
+SAMPLE_FILES = join(dirname(__file__), "sample_files")
+
+IF = ('if', {'one_year': '3.5', 'five_year': '4'})
+PPV = ('ppv', {'gbp': 1, 'eur': 2, 'usd': 3})
+RANKINGS = ('rankings', {'rankings': [('Oncology', '4 out of 220'),
+                                      ('Surgery', '2 out of 95'),
+                                      ('Women\'s Health "Reviews"', '10 out of 42'),
+                                      ('Cardiology', '8 out of 150')]})
+
+# (sample file, edits made to it)
+CASES = [
+    ('sample_data.xml', [IF, PPV]),
+    ('sample_data_second_block.xml', [IF, PPV]),
+    ('sample_rankings.txt', [RANKINGS]),
+]
+
+
+def modify(directory, source_path, operation, payload, streaming_threshold):
+    '''
+    The file written by making the edit to the source file, and whether it was reported as changed.
+    '''
+    site = FileToUpdate('sample', operation)
+    site.original_file_path = join(directory, 'original.xml')
+    site.new_file_path = join(directory, 'new.xml')
+    copyfile(source_path, site.original_file_path)
+
+    SiteDocument.streaming_threshold = streaming_threshold
+    ModifyFile.apply(site, operation, payload)
+    changed = SiteDocument.commit(site)
+
+    with open(site.new_file_path, 'rb') as f:
+        return f.read(), changed
+
+
+def main():
+    failures = 0
+
+    with TemporaryDirectory() as directory:
+        for file_name, edits in CASES:
+            for operation, payload in edits:
+                source_path = join(SAMPLE_FILES, file_name)
+
+                whole = modify(directory, source_path, operation, payload, None)
+                streamed = modify(directory, source_path, operation, payload, 0)
+
+                # The edit made again to its own output
+                rerun_path = join(directory, 'rerun.xml')
+                with open(rerun_path, 'wb') as f:
+                    f.write(whole[0])
+
+                rerun_changed = [modify(directory, rerun_path, operation, payload, threshold)[1]
+                                 for threshold in (None, 0)]
+
+                problems = []
+                if streamed[0] != whole[0]:
+                    problems.append("streamed file differs")
+                if not whole[1] or not streamed[1]:
+                    problems.append("not reported as changed")
+                if any(rerun_changed):
+                    problems.append("reported as changed again when re-run")
+
+                print(f"{file_name} {operation}: {', '.join(problems) or 'ok'}")
+                failures += len(problems)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+'''
+Compare the XPathRegistry queries, and the ranking name lookup, against the expressions they replaced.
+
+Usage: python benchmarks/xpath_registry.py [config.xml] [data.xml] [rankings.txt]
+
+With no arguments the sample files in benchmarks/sample_files are used. Downloaded Sitebuilder
+files can be given instead; every query must return the same nodes, in the same order, both ways.
+'''
+import sys
+from os.path import dirname, join
+from timeit import repeat
+
+from lxml import etree as et
+
+from sitebuilder_interaction_tasks.ModifyFile import ModifyFile
+from sitebuilder_interaction_tasks.XPathRegistry import XPathRegistry
+
+ROUNDS = 5
+NUMBER = 200
+
+SAMPLE_FILES = [join(dirname(__file__), "sample_files", x)
+                for x in ("sample_config.xml", "sample_data.xml", "sample_rankings.txt")]
+
+first = XPathRegistry.first
+
+# (name, the expression previously evaluated on each call, the query that replaced it), per file
+CONFIG_QUERIES = [
+    ('main_content_block', lambda root: root.xpath('//Location[@name="MainContent"]/Block'),
+     lambda root: XPathRegistry.main_content_block(root)),
+    ('home_page', lambda root: root.xpath('//Page[@name="Home"]'),
+     lambda root: XPathRegistry.home_page(root)),
+    ('page_settings', lambda root: root.xpath('//PageSettings'),
+     lambda root: XPathRegistry.page_settings(root)),
+    ('site_template_settings', lambda root: root.xpath('//SiteTemplateSettings'),
+     lambda root: XPathRegistry.site_template_settings(root)),
+    ('widget_settings', lambda root: root.xpath('//WidgetSettings'),
+     lambda root: XPathRegistry.widget_settings(root)),
+    ('right_rail_block', lambda root: root.xpath(".//*[@name='RightRail']/Block"),
+     lambda root: XPathRegistry.right_rail_block(root)),
+    ('related_content', lambda root: root.find(".//*[@type='RelatedContent']"),
+     lambda root: first(XPathRegistry.related_content, root)),
+    ('related_pubmed', lambda root: root.find(".//*[@type='RelatedPubMed']"),
+     lambda root: first(XPathRegistry.related_pubmed, root)),
+    ('trendmd_block_widget', lambda root: root.find(".//Block/*[@type='TrendMD']"),
+     lambda root: first(XPathRegistry.trendmd_block_widget, root)),
+    ('trendmd_widget_setting', lambda root: root.find(".//WidgetSettings/*[@type='TrendMD']"),
+     lambda root: first(XPathRegistry.trendmd_widget_setting, root)),
+    ('widget_setting_named', lambda root: root.xpath(".//WidgetSettings/*[@instanceName='most_read']"),
+     lambda root: XPathRegistry.widget_setting_named(root, name='most_read')),
+]
+
+DATA_QUERIES = [
+    ('current_impact_factors', lambda root: root.xpath(".//ImpactFactor[@current='true']"),
+     lambda root: XPathRegistry.current_impact_factors(root)),
+    ('impact_factors', lambda root: root.xpath(".//ImpactFactors"),
+     lambda root: XPathRegistry.impact_factors(root)),
+    ('impact_factors_for_year', lambda root: root.xpath(".//ImpactFactor[@year='2019']"),
+     lambda root: XPathRegistry.impact_factors_for_year(root, year='2019')),
+    ('prices', lambda root: root.find('.//Prices'),
+     lambda root: first(XPathRegistry.prices, root)),
+    ('price', lambda root: root.find('.//Prices').findall('Price'),
+     lambda root: XPathRegistry.price(first(XPathRegistry.prices, root))),
+]
+
+RANKINGS_QUERIES = [
+    ('current_ranks', lambda root: root.xpath(".//rank[@current='true']"),
+     lambda root: XPathRegistry.current_ranks(root)),
+    ('ranks_for_year', lambda root: root.find('category').findall("rank[@year='2019']"),
+     lambda root: XPathRegistry.ranks_for_year(root.find('category'), year='2019')),
+]
+
+# The category names were looked up with ".//*[text()='<name>']", which fails for a name
+# containing a quote, so each name is looked up through an XPath variable instead
+RANKING_NAMES = ['Oncology', 'Surgery', 'Women\'s Health "Reviews"']
+
+RANKINGS_QUERIES += [
+    (f'first_elements_by_text {name}',
+     lambda root, name=name: next(iter(root.xpath('.//*[text()=$name]', name=name)), None),
+     lambda root, name=name: ModifyFile.first_elements_by_text(root, {name}).get(name))
+    for name in RANKING_NAMES
+]
+
+
+def main(paths):
+    paths = paths + SAMPLE_FILES[len(paths):]
+    failures = 0
+
+    for path, queries in zip(paths, [CONFIG_QUERIES, DATA_QUERIES, RANKINGS_QUERIES]):
+        root = et.parse(path, XPathRegistry.parser).getroot()
+
+        for name, old, new in queries:
+            expected = old(root)
+            actual = new(root)
+
+            # The same element objects, not just equal ones
+            if isinstance(expected, list):
+                same = len(expected) == len(actual) and all(x is y for x, y in zip(expected, actual))
+            else:
+                same = expected is actual
+
+            if not same:
+                print(f"{name}: results differ\n  before: {expected}\n  now: {actual}")
+                failures += 1
+                continue
+
+            old_time = min(repeat(lambda: old(root), repeat=ROUNDS, number=NUMBER)) / NUMBER
+            new_time = min(repeat(lambda: new(root), repeat=ROUNDS, number=NUMBER)) / NUMBER
+
+            matched = len(expected) if isinstance(expected, list) else int(expected is not None)
+
+            print(f"{name} ({matched} node(s)): before {old_time * 1e6:.1f} us, "
+                  f"now {new_time * 1e6:.1f} us, speed-up {old_time / new_time:.1f}x")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,36 @@
+from argparse import ArgumentParser
+
 from sitebuilder_interaction_tasks.TerminalUI import TerminalUI
 
 if __name__ == "__main__":
-    TerminalUI().run()
+    parser = ArgumentParser(description="Sitebuilder interactions terminal program")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of sites to download, upload or publish at once (default: 1, one at a time)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="move each site through download, modify, upload and publish on its own "
+                        "instead of finishing each stage for every site first")
+    parser.add_argument("--reuse-ttl", type=int, default=None, metavar="SECONDS",
+                        help="reuse files in the \"original\" folder downloaded within the last SECONDS, "
+                        "and older ones that Sitebuilder reports unchanged")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="number of worker processes to modify XML files in (default: 0, modify them in this process)")
+    parser.add_argument("--stream-threshold", type=float, default=None, metavar="MB",
+                        help="apply IF, rankings and PPV updates to files of at least MB megabytes while "
+                        "streaming them, instead of loading the whole file")
+    parser.add_argument("--review", action="store_true",
+                        help="report what changed in each modified file and ask before uploading "
+                        "(runs the stages one at a time)")
+    parser.add_argument("--monthly-archive", action="store_true",
+                        help="append each ACL run to the month's compressed archive instead of writing "
+                        "a spreadsheet for each day")
+    parser.add_argument("--resume", type=int, default=None, metavar="RUN_ID",
+                        help="carry on with an interrupted run, taking each site on from the last stage it finished")
+    args = parser.parse_args()
+
+    stream_threshold = None
+    if args.stream_threshold is not None:
+        stream_threshold = int(args.stream_threshold * 1024 * 1024)
+
+    TerminalUI(workers=args.workers, pipeline=args.pipeline, reuse_ttl=args.reuse_ttl,
+               processes=args.processes, stream_threshold=stream_threshold, review=args.review,
+               monthly_archive=args.monthly_archive, resume=args.resume).run()
@@ -0,0 +1,108 @@
+import gzip
+import json
+from os import replace
+from os.path import exists, splitext
+from time import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+class AclArchive:
+    '''
+    ACL request archives, written a chunk of rows at a time so that a large backlog is never
+    held in memory as a whole workbook.
+
+    A run is either archived to its own spreadsheet, through a write-only workbook, or appended
+    to a running monthly archive: a gzipped JSON lines file with one gzip member per run and an
+    index beside it recording each run's offset, length, row count and sites, so that one run
+    can be read back without decompressing the rest of the month.
+    '''
+
+    # Rows converted for writing at a time
+    chunk_size = 5000
+
+    @classmethod
+    def rows(cls, df):
+        '''
+        Each row of the dataframe as a list of plain Python values, with None where a value is missing.
+        '''
+        for start in range(0, len(df), cls.chunk_size):
+            chunk = df.iloc[start:start + cls.chunk_size].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+
+            yield from chunk.itertuples(index=False, name=None)
+
+    @classmethod
+    def write_workbook(cls, df, file_path):
+        '''
+        Write the dataframe to a spreadsheet laid out as DataFrame.to_excel would with index=False.
+        '''
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Sheet1')
+
+        worksheet.append([str(x) for x in df.columns])
+
+        for row in cls.rows(df):
+            worksheet.append(row)
+
+        partial_file_path = f'{splitext(file_path)[0]}.part.xlsx'
+        workbook.save(partial_file_path)
+        replace(partial_file_path, file_path)
+
+    @staticmethod
+    def index_path(archive_path):
+        return f"{archive_path[:-len('.jsonl.gz')]}.index.json"
+
+    @classmethod
+    def load_index(cls, archive_path):
+        index_path = cls.index_path(archive_path)
+
+        if not exists(index_path):
+            return []
+
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @classmethod
+    def append_monthly(cls, df, archive_path):
+        '''
+        Append the dataframe to the monthly archive as one gzip member, and record it in the index.
+        '''
+        columns = [str(x) for x in df.columns]
+
+        with open(archive_path, 'ab') as f:
+            offset = f.tell()
+
+            with gzip.GzipFile(fileobj=f, mode='wb') as g:
+                for row in cls.rows(df):
+                    g.write(json.dumps(dict(zip(columns, row)), default=str).encode('utf-8') + b'\n')
+
+            length = f.tell() - offset
+
+        index = cls.load_index(archive_path)
+        index.append({
+            'archived_at': time(),
+            'offset': offset,
+            'length': length,
+            'rows': len(df),
+            'url_shortcodes': sorted(str(x) for x in df['url_shortcode'].dropna().unique())
+        })
+
+        index_path = cls.index_path(archive_path)
+        partial_index_path = f'{index_path}.part'
+
+        with open(partial_index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+
+        replace(partial_index_path, index_path)
+
+    @staticmethod
+    def read_run(archive_path, entry):
+        '''
+        The rows of one run in the monthly archive, given its entry in the index.
+        '''
+        with open(archive_path, 'rb') as f:
+            f.seek(entry['offset'])
+            member = f.read(entry['length'])
+
+        return pd.DataFrame([json.loads(x) for x in gzip.decompress(member).splitlines()])
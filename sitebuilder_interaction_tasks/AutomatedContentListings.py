@@ -1,17 +1,25 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from hashlib import sha256
+from io import StringIO
 from os.path import abspath, join, exists, getctime
 from os import getlogin
-from os import remove
-from os import listdir
 import sys
 from datetime import date
 from time import gmtime
+from threading import Lock
 
 import pandas as pd
 from tqdm import tqdm
 
+from sitebuilder_interaction_tasks.AclArchive import AclArchive
+
+# One ACL request file read by AutomatedContentListings.read_acl_request
+AclRequest = namedtuple('AclRequest', ['file_path', 'acl_settings_df', 'created_date', 'file_hash'])
+
 class AutomatedContentListings:
     '''
-    ACL combination and deletion.
+    ACL combination.
     '''
     
     current_dir = abspath("")
@@ -48,9 +56,25 @@ class AutomatedContentListings:
     date_y_m_d = date.strftime("%y_%m_%d")
 
     acl_settings_xlsx = join(current_dir, 'data', 'acl_config_settings.xlsx')
+    # Copy of the working list kept to recover a run from, read much faster than the spreadsheet
+    acl_settings_pickle = join(current_dir, 'data', 'acl_config_settings.pkl')
     acl_archive_file = join(teams_acl_root, "Archive", f"{date_y_m_d}_acl_config_settings.xlsx")
+    acl_monthly_archive_file = join(teams_acl_root, "Archive", f"{date.strftime('%y_%m')}_acl_config_settings.jsonl.gz")
+    
+    # Append each run to the month's archive rather than writing a spreadsheet for each day
+    monthly_archive = False
+    
+    # Number of ACL request files read at once
+    read_workers = 16
+    
+    # The working list for this run, and its widget requests grouped by url_shortcode
+    working_list_df = None
+    working_list = None
+    _working_list_lock = Lock()
     
-    deletion_list = list()
+    # The exports are written by one background thread, see export
+    export_executor = None
+    exports = []
     
     def check_share_locations_exist(self):
         '''
@@ -62,44 +86,96 @@ class AutomatedContentListings:
             sys.exit(0)
     
     @classmethod
-    def combine_acl_lists(cls, file: str):
+    def read_acl_request(cls, file: str):
         '''
-        Take the individual, single line, ACL requests and combine them into one dataframe.
+        Read one ACL request file, returning its rows, the d/m/y date the file was created and
+        the SHA-256 of its content as an AclRequest.
         
-        If there are any erroneous UTF-8 characters open with different encoding to replace
-        the offending characters.
+        The file is read once and decoded as UTF-8, or as ISO-8859-1 with any curly quotes in
+        the AdvancedQuery replaced if it is not valid UTF-8.
         '''
-        
         individual_request_location = join(cls.acl_requests_dir, file)
-        cls.deletion_list.append(individual_request_location)
         
-        tqdm.write(individual_request_location)
-
+        with open(individual_request_location, 'rb') as f:
+            content = f.read()
+        
+        created_date = gmtime(getctime(individual_request_location))
+        
         try:
-            acl_settings_df = pd.read_csv(individual_request_location)
-        except Exception as e:
-            print(e)
-            acl_settings_df = pd.read_csv(individual_request_location, encoding = "ISO-8859-1")
-            acl_settings_df['AdvancedQuery'][0] = acl_settings_df['AdvancedQuery'][0].replace('\x93', '"').replace('\x94', '"')
-
+            acl_settings_df = pd.read_csv(StringIO(content.decode('utf-8')))
+        
+        except UnicodeDecodeError as e:
+            tqdm.write(f'{file}: {e}')
+            acl_settings_df = pd.read_csv(StringIO(content.decode('ISO-8859-1')))
+            
+            if 'AdvancedQuery' in acl_settings_df.columns:
+                acl_settings_df['AdvancedQuery'] = (acl_settings_df['AdvancedQuery']
+                                                    .str.replace('\x93', '"', regex=False)
+                                                    .str.replace('\x94', '"', regex=False))
+        
         acl_settings_df.dropna(axis=0, how='all', inplace=True)
-
-        try:
-            acl_settings_df.rename(columns={'TitleText':'Title.Text','TitleEnabled':'Title.Enabled'}, inplace=True)
-        except:
-            pass
-
-        cls.combined_acl_requests_df = cls.combined_acl_requests_df.append(acl_settings_df)
-
-        created_date = gmtime(getctime(individual_request_location))
-        d_m_y = f'{created_date[2]}/{created_date[1]}/{created_date[0]}'
-        for i in range(len(acl_settings_df)):
-            cls.created_date_list.append(d_m_y)
+        acl_settings_df.rename(columns={'TitleText':'Title.Text','TitleEnabled':'Title.Enabled'}, inplace=True)
+        
+        return AclRequest(individual_request_location, acl_settings_df,
+                          f'{created_date[2]}/{created_date[1]}/{created_date[0]}', sha256(content).hexdigest())
+    
+    @classmethod
+    def compact_dtypes(cls, df):
+        '''
+        Store url_shortcode as a category and the Enabled settings as bools, with a missing
+        setting as False.
+        '''
+        df['url_shortcode'] = df['url_shortcode'].astype('category')
+        
+        for column in [k for k, v in cls.dtypes.items() if v == 'bool' and k in df.columns]:
+            if df[column].dtype != bool:
+                df[column] = df[column].astype(str).str.lower().isin(['true', '1', '1.0'])
+        
+        return df
+    
+    @classmethod
+    def combine_acl_lists(cls, files, checkpoint=None):
+        '''
+        Take the individual, single line, ACL requests and combine them into one dataframe.
+        
+        The files, which are on a synced SharePoint folder, are read concurrently and
+        combined in one go. With an IngestCheckpoint, files already committed are deleted
+        and left out, so only new or unfinished requests are combined.
+        
+        Returns the AclRequests combined.
+        '''
+        with ThreadPoolExecutor(max_workers=cls.read_workers) as executor:
+            requests = list(executor.map(cls.read_acl_request, files))
+        
+        if checkpoint is not None:
+            for request in requests:
+                if checkpoint.is_committed(request.file_path, request.file_hash):
+                    tqdm.write(f'{request.file_path} has already been applied, removing it')
+                    checkpoint.commit(request.file_path, request.file_hash)
+            
+            requests = [x for x in requests if not checkpoint.is_committed(x.file_path, x.file_hash)]
+        
+        # Each batch starts afresh
+        cls.created_date_list = []
+        cls.combined_acl_requests_df = pd.DataFrame()
+        
+        for request in requests:
+            tqdm.write(request.file_path)
+            cls.created_date_list.extend([request.created_date] * len(request.acl_settings_df))
+        
+        if requests:
+            combined_acl_requests_df = pd.concat([x.acl_settings_df for x in requests], ignore_index=True, sort=False)
+            cls.combined_acl_requests_df = cls.compact_dtypes(combined_acl_requests_df)
+        
+        return requests
     
     def create_working_list_and_archive_dataframe(self, combined_dataframe):
         '''
-        Create excel spreadsheets to store as archive, for future reference, and as the file to
-        work from whilst adding the new ACL settings.
+        Create the working list to add the new ACL settings from, and the spreadsheets of it
+        and of the archive, for future reference.
+        
+        The working list is kept in memory and as a pickle, to recover from; the spreadsheet
+        and archive are only exports, written in the background while the sites are processed.
         '''
         
         try:
@@ -112,29 +188,131 @@ class AutomatedContentListings:
 
             combined_acl_requests_no_nan = combined_dataframe[~combined_dataframe['url_shortcode'].isna()]
 
-            # Note change occurences of acl_settings_xlsx for combined_acl_requests df
-            # and then remove this save
-            combined_acl_requests_no_nan.to_excel(self.acl_settings_xlsx, index=False)
+            combined_acl_requests_no_nan.to_pickle(self.acl_settings_pickle)
+            
+            with self._working_list_lock:
+                AutomatedContentListings.working_list_df = combined_acl_requests_no_nan
+                AutomatedContentListings.working_list = self.working_list_requests(combined_acl_requests_no_nan)
 
             # Create a new column in the archive of the date list
             # to use for tracking purposes
             combined_dataframe['created_date'] = self.created_date_list
 
-            # Save a copy of the combined dataframe to an archive
-            combined_dataframe.to_excel(self.acl_archive_file, index=False)
+            self.export(self.acl_settings_xlsx, AclArchive.write_workbook, combined_acl_requests_no_nan)
+            
+            if self.monthly_archive:
+                self.export(self.acl_monthly_archive_file, AclArchive.append_monthly, combined_dataframe)
+            else:
+                self.export(self.acl_archive_file, AclArchive.write_workbook, combined_dataframe)
         except Exception as e:
-            tqdm.write(e)
+            tqdm.write(str(e))
+    
+    @classmethod
+    def export(cls, file_path, write, df):
+        '''
+        Write the dataframe to file_path with write(df, file_path) on a background thread, see
+        wait_for_exports.
+        '''
+        if cls.export_executor is None:
+            cls.export_executor = ThreadPoolExecutor(max_workers=1)
         
+        cls.exports.append((file_path, cls.export_executor.submit(write, df, file_path)))
+    
     @classmethod
-    def delete_all_acls(cls):
+    def wait_for_exports(cls):
         '''
-        Function to delete all requests from the active working directory.
+        Wait for the exports being written, reporting any that could not be.
+        '''
+        wait([future for file_path, future in cls.exports])
+        
+        for file_path, future in cls.exports:
+            if future.exception() is not None:
+                tqdm.write(f'Could not write {file_path}: {future.exception()}')
+        
+        cls.exports = []
+        
+    @staticmethod
+    def widget_setting(name, value, alnp):
+        '''
+        A widget setting as a (name, value) pair of strings, or None if the widget leaves it out.
         
-        ---WARNING---
-        Only run after all code has completed succesfully to ensure nothing is removed too soon.
+        Missing values are left out, as are the Mode, ArticleListPageSize and NumYearsOfCitations
+        settings of Magic widgets and any setting of an ALNP widget whose value is false or 0.
+        "true"/"false" variants are title cased and "&quot;"/"&amp;" decoded (ElementTree
+        encodes them again).
         '''
-        for x in listdir(cls.acl_requests_dir):
-            request_location = join(cls.acl_requests_dir, x)
+        if pd.isnull(value):
+            return None
+        
+        if alnp:
+            if value in ('FALSE', 'False', 'false', False):
+                return None
+        
+        elif name in ('Mode', 'ArticleListPageSize', 'NumYearsOfCitations'):
+            return None
+        
+        value = str(value)
+        
+        if value in ('TRUE', 'FALSE', 'true', 'false'):
+            value = value.title()
+        
+        if '&quot;' in value or '&amp;' in value:
+            value = value.replace('&quot;', '"').replace('&amp;', '&')
+        
+        return str(name), value
+    
+    @classmethod
+    def working_list_requests(cls, df):
+        '''
+        Turn the working list into widget requests grouped by url_shortcode.
+        
+        Each request is a plain dictionary of the widget's instance name, type and its settings
+        as (name, value) pairs in column order, ready for ModifyFile.acl_widget, which builds the
+        XML once for each distinct request. Columns that are not widget settings are left out.
+        '''
+        working_list = {}
+        
+        for row in df.to_dict('records'):
+            url_shortcode = row.pop('url_shortcode')
+            instance_name = row.pop('instance_name')
+            row.pop('UserEmail', None)
+            row.pop('TimeRequested', None)
+            
+            # Rows without both columns cannot be ALNP widgets
+            try:
+                combined = not pd.isnull(row['CombinedModeList'])
+                alnp = row['Mode'] in ('MostRead', 'MostCited') or combined
+            except KeyError:
+                combined = alnp = False
+            
+            settings = tuple(x for x in (cls.widget_setting(k, v, alnp) for k, v in row.items())
+                             if x is not None)
+            
+            request = {
+                'instance_name': instance_name,
+                'widget': 'alnp' if alnp else 'magic',
+                'combined': combined,
+                'settings': settings
+            }
             
-            if request_location in cls.deletion_list:
-                remove(request_location)
+            working_list.setdefault(url_shortcode, []).append(request)
+        
+        return working_list
+    
+    @classmethod
+    def get_working_list(cls):
+        '''
+        The working list's widget requests grouped by url_shortcode.
+        
+        Outside of a run, e.g. after a crash, the working list is read back from its pickle.
+        '''
+        with cls._working_list_lock:
+            if cls.working_list is None:
+                cls.working_list_df = pd.read_pickle(cls.acl_settings_pickle)
+                cls.working_list = cls.working_list_requests(cls.working_list_df)
+
+        return cls.working_list
+    
+    @classmethod
+    def working_list_rows(cls, journal_shortcode):
+        return cls.get_working_list().get(journal_shortcode, [])
@@ -0,0 +1,95 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+
+class ConcurrentStage:
+    '''
+    Run one per-site stage over a list of sites.
+
+    With a single worker the sites are processed one after another, as they always have been,
+    otherwise they are spread across a bounded pool of worker threads.
+    '''
+
+    stage = None
+    desc = None
+
+    # Journal each site's result is recorded in, see RunJournal, None records nothing
+    journal = None
+
+    # Called with each site and its result as the site finishes the stage, if set
+    on_result = None
+
+    def __init__(self, workers=1):
+        self.workers = max(1, int(workers))
+
+    def process(self, site):
+        '''
+        Carry out the stage for one site and return a SiteResult.
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+        Release anything the stage holds on to once a run is finished.
+        '''
+        pass
+
+    def process_safely(self, site):
+        start = perf_counter()
+
+        try:
+            result = self.process(site)
+        except Exception as e:
+            tqdm.write(f'{site.journal_shortcode}: {e}')
+            result = SiteResult(site.journal_shortcode, self.stage, SiteResult.ERROR,
+                                latency=perf_counter() - start, error=str(e))
+
+        if self.journal is not None:
+            self.journal.record(site, result)
+
+        if ConcurrentStage.on_result is not None:
+            ConcurrentStage.on_result(site, result)
+
+        return result
+
+    def run(self, sites):
+        '''
+        Return one SiteResult per site, in the same order as the sites were given.
+        '''
+        sites = list(sites)
+        results = {}
+
+        with tqdm(total=len(sites), desc=self.desc, position=0, leave=True, file=sys.stdout) as progress:
+            if self.workers == 1:
+                for site in sites:
+                    results[site.journal_shortcode] = self.process_safely(site)
+                    progress.update()
+
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    futures = {executor.submit(self.process_safely, site): site for site in sites}
+
+                    for future in as_completed(futures):
+                        results[futures[future].journal_shortcode] = future.result()
+                        progress.update()
+
+        return [results[site.journal_shortcode] for site in sites]
+
+    def summarise(self, results):
+        statuses = {}
+        for result in results:
+            statuses.setdefault(result.status, []).append(result.journal_shortcode)
+
+        total_bytes = sum(result.bytes for result in results)
+        total_latency = sum(result.latency for result in results)
+
+        tqdm.write(f'\n{self.desc}{len(results)} site(s), {total_bytes} bytes, '
+                   f'{total_latency:.1f}s total latency')
+
+        for status, journals in statuses.items():
+            if status != SiteResult.OK:
+                tqdm.write(f'{status}: {", ".join(journals)}')
@@ -0,0 +1,13 @@
+from sitebuilder_interaction_tasks.ConcurrentStage import ConcurrentStage
+from sitebuilder_interaction_tasks.SitebuilderInteraction import SitebuilderInteraction
+
+class DownloadStage(ConcurrentStage):
+    '''
+    Download each site's file into the "original" folder.
+    '''
+
+    stage = 'download'
+    desc = 'Downloading XML files: '
+
+    def process(self, site):
+        return SitebuilderInteraction.get_data(site)
@@ -0,0 +1,32 @@
+from hashlib import sha256
+
+from lxml import etree as et
+
+class FileComparison:
+    '''
+    Compare a site's original and modified files by content rather than by bytes on disk.
+    '''
+
+    # Whitespace between elements is not significant in any of the Sitebuilder files
+    parser = et.XMLParser(remove_blank_text=True, huge_tree=True)
+
+    @classmethod
+    def canonical_hash(cls, file_path):
+        '''
+        SHA-256 of the file's canonical (C14N) XML, so that attribute order, quoting, empty
+        element style and indentation do not count as changes.
+
+        Files that are not well-formed XML are hashed as they are.
+        '''
+        try:
+            tree = et.parse(file_path, cls.parser)
+            content = et.tostring(tree, method='c14n')
+        except et.XMLSyntaxError:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+
+        return sha256(content).hexdigest()
+
+    @classmethod
+    def is_unchanged(cls, site):
+        return cls.canonical_hash(site.original_file_path) == cls.canonical_hash(site.new_file_path)
@@ -15,4 +15,7 @@ class FileToUpdate:
         self.original_file_path = join(self.current_dir, "original", f"{self.journal_shortcode}_{self.file_extension}")
         self.new_file_path = join(self.current_dir, "new", f"{self.journal_shortcode}_{self.file_extension}")
         
+        # Parsed XML shared by every edit to this file until it is committed, see SiteDocument
+        self.document = None
+        
         self.files_dict[self.journal_shortcode] = self
\ No newline at end of file
@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from os import mkdir, remove
+from os.path import abspath, basename, exists, join
+
+import pandas as pd
+from lxml import etree as et
+from tqdm import tqdm
+
+class FleetDiff:
+    '''
+    Structural diff of each file in the "original" folder against its modified copy in "new".
+
+    Elements are matched by their path, where each step is the tag plus the first identifying
+    attribute it has, e.g. WidgetSetting[@instanceName='most_read'], so an inserted widget
+    shows as one added node rather than shifting its siblings. Whitespace between elements,
+    comments and attribute order are not counted as changes.
+
+    Subtrees that serialise identically are skipped without being walked, so the work done for
+    each file grows with what changed rather than with the size of the file. Files are compared
+    across a pool of processes.
+    '''
+
+    key_attributes = ('instanceName', 'name', 'type', 'year', 'startDate')
+
+    parser = et.XMLParser(remove_blank_text=True, remove_comments=True, remove_pis=True, huge_tree=True)
+
+    report_dir = join(abspath(""), 'diff')
+
+    # Longest added or removed element shown in full in a file's detail
+    max_detail_length = 2000
+
+    def __init__(self, processes=None):
+        # None uses a process for each CPU
+        self.processes = processes
+
+    @classmethod
+    def step(cls, element):
+        for attribute in cls.key_attributes:
+            if attribute in element.attrib:
+                return f"{element.tag}[@{attribute}='{element.attrib[attribute]}']"
+
+        return element.tag
+
+    @classmethod
+    def children(cls, element, path):
+        '''
+        The element's child elements keyed by path, numbering any that share a step.
+        '''
+        children = {}
+        counts = {}
+
+        for child in element.iterchildren(et.Element):
+            step = cls.step(child)
+            counts[step] = counts.get(step, 0) + 1
+
+            children[f"{path}/{step}" if counts[step] == 1 else f"{path}/{step}[{counts[step]}]"] = child
+
+        return children
+
+    @staticmethod
+    def text(element):
+        return (element.text or '').strip()
+
+    @classmethod
+    def compare(cls, original, new, path, diff):
+        changes = []
+
+        if cls.text(original) != cls.text(new):
+            changes.append(f"text {cls.text(original)!r} -> {cls.text(new)!r}")
+
+        for name in sorted(set(original.attrib) | set(new.attrib)):
+            if original.get(name) != new.get(name):
+                changes.append(f"@{name} {original.get(name)!r} -> {new.get(name)!r}")
+
+        if changes:
+            diff['changed'].append((path, changes))
+
+        original_children = cls.children(original, path)
+        new_children = cls.children(new, path)
+
+        for child_path, child in original_children.items():
+            if child_path not in new_children:
+                diff['removed'].append((child_path, child))
+
+        for child_path, child in new_children.items():
+            if child_path not in original_children:
+                diff['added'].append((child_path, child))
+
+            elif et.tostring(child) != et.tostring(original_children[child_path]):
+                cls.compare(original_children[child_path], child, child_path, diff)
+
+    @classmethod
+    def describe(cls, element):
+        description = et.tostring(element, encoding='unicode', pretty_print=True).strip()
+
+        if len(description) > cls.max_detail_length:
+            description = description[:cls.max_detail_length] + ' ...'
+
+        return description
+
+    @classmethod
+    def diff_files(cls, original_file_path, new_file_path):
+        '''
+        Compare one pair of files, returning the summary counts and the detail as text.
+        '''
+        file_name = basename(new_file_path)
+        diff = {'added': [], 'removed': [], 'changed': []}
+
+        try:
+            with open(original_file_path, 'rb') as f, open(new_file_path, 'rb') as g:
+                original_content = f.read()
+                new_content = g.read()
+
+        except OSError as e:
+            return {'file': file_name, 'added': 0, 'removed': 0, 'changed': 1,
+                    'detail': f"Not compared: {e}\n"}
+
+        # Most files in a run are untouched, e.g. no-op sites, and need no parsing
+        if original_content == new_content:
+            return {'file': file_name, 'added': 0, 'removed': 0, 'changed': 0, 'detail': ''}
+
+        try:
+            original = et.fromstring(original_content, cls.parser)
+            new = et.fromstring(new_content, cls.parser)
+
+        except et.XMLSyntaxError as e:
+            # Files that cannot be parsed, e.g. an empty rankings file, have changed as a whole
+            return {'file': file_name, 'added': 0, 'removed': 0, 'changed': 1,
+                    'detail': f"Not compared structurally: {e}\n"}
+
+        if et.tostring(original) != et.tostring(new):
+            if original.tag != new.tag:
+                diff['removed'].append((f"/{cls.step(original)}", original))
+                diff['added'].append((f"/{cls.step(new)}", new))
+            else:
+                cls.compare(original, new, f"/{cls.step(new)}", diff)
+
+        detail = []
+
+        for path, element in diff['added']:
+            detail.append(f"+ {path}\n{cls.describe(element)}\n")
+
+        for path, element in diff['removed']:
+            detail.append(f"- {path}\n{cls.describe(element)}\n")
+
+        for path, changes in diff['changed']:
+            detail.append(f"~ {path}\n" + "".join(f"    {x}\n" for x in changes))
+
+        return {'file': file_name, 'added': len(diff['added']), 'removed': len(diff['removed']),
+                'changed': len(diff['changed']), 'detail': "\n".join(detail)}
+
+    @staticmethod
+    def folder_pairs(original_dir, new_dir):
+        '''
+        Each file in new_dir that has an original in original_dir.
+        '''
+        return [(join(original_dir, basename(x)), x) for x in sorted(glob(join(new_dir, '*')))
+                if exists(join(original_dir, basename(x)))]
+
+    def run(self, pairs):
+        '''
+        Compare each (original file path, new file path) pair and write the report.
+        '''
+        results = []
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            for result in tqdm(executor.map(self.diff_files, *zip(*pairs), chunksize=8) if pairs else [],
+                               desc='Comparing files: ', total=len(pairs)):
+                results.append(result)
+
+        self.write_report(results)
+
+        return results
+
+    def write_report(self, results):
+        '''
+        Write summary.txt, with the number of added, removed and changed nodes in each file, and
+        a detail file for each file that changed to the "diff" folder, replacing the last report.
+        '''
+        if not exists(self.report_dir):
+            mkdir(self.report_dir)
+
+        for x in glob(join(self.report_dir, '*.txt')):
+            remove(x)
+
+        summary = pd.DataFrame(results, columns=['file', 'added', 'removed', 'changed'])
+
+        with open(join(self.report_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(summary.to_string(index=False) if len(summary) > 0 else 'No files to compare')
+            f.write('\n')
+
+        for result in results:
+            if result['detail']:
+                with open(join(self.report_dir, f"{result['file']}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(result['detail'])
+
+    def summarise(self, results):
+        changed = [x for x in results if x['added'] or x['removed'] or x['changed']]
+
+        tqdm.write(f"\n{len(changed)} of {len(results)} files changed "
+                   f"({sum(x['added'] for x in results)} nodes added, "
+                   f"{sum(x['removed'] for x in results)} removed, "
+                   f"{sum(x['changed'] for x in results)} changed). "
+                   f"See {join(self.report_dir, 'summary.txt')} and the file details beside it.")
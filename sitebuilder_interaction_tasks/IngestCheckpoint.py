@@ -0,0 +1,138 @@
+import json
+from os import remove, replace
+from os.path import abspath, basename, join
+from threading import RLock
+from time import time
+
+from tqdm import tqdm
+
+class IngestCheckpoint:
+    '''
+    Record of each ACL request file taken from the "ACL Requests" folder, kept in the "data"
+    folder so that an interrupted run can carry on where it stopped.
+
+    Each file is recorded by name and SHA-256 as processing while its sites are being modified
+    and published, with the sites still to go, and as committed, with the file deleted, as soon
+    as the last of them has been, see site_finished. Files that are new, changed or still
+    processing are picked up by the next run.
+    '''
+
+    PROCESSING = 'processing'
+    COMMITTED = 'committed'
+
+    checkpoint_path = join(abspath(""), 'data', 'acl_ingest_checkpoint.json')
+
+    def __init__(self, checkpoint_path=None):
+        self.checkpoint_path = checkpoint_path or self.checkpoint_path
+
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+        # Files marked processing by this run, the only ones site_finished commits
+        self.batch = {}
+
+        # Sites finish on the stages' worker threads
+        self._lock = RLock()
+
+    def state(self, file_path, file_hash):
+        '''
+        The file's state, or None if this content of it has not been seen before.
+        '''
+        entry = self.entries.get(basename(file_path))
+
+        if entry is None or entry['sha256'] != file_hash:
+            return None
+
+        return entry['state']
+
+    def is_committed(self, file_path, file_hash):
+        return self.state(file_path, file_hash) == self.COMMITTED
+
+    def mark_processing(self, file_path, file_hash, url_shortcodes):
+        '''
+        Record the file as processing until each of the sites it requests has finished. A file
+        that requests no site has nothing to wait for, so it is committed straight away.
+        '''
+        if not url_shortcodes:
+            tqdm.write(f'{file_path} has no sites to update, removing it')
+            self.commit(file_path, file_hash)
+            return
+
+        with self._lock:
+            self.entries[basename(file_path)] = {
+                'sha256': file_hash,
+                'state': self.PROCESSING,
+                'url_shortcodes': sorted(url_shortcodes),
+                'remaining': sorted(url_shortcodes),
+                'updated_at': time()
+            }
+            self.batch[basename(file_path)] = file_path
+            self.save()
+
+    def resume(self, requests_dir):
+        '''
+        Take on the files still processing from an earlier run, e.g. when the run is resumed.
+        '''
+        with self._lock:
+            for file_name, entry in list(self.entries.items()):
+                if entry['state'] != self.PROCESSING:
+                    continue
+
+                if entry.get('remaining'):
+                    self.batch[file_name] = join(requests_dir, file_name)
+                else:
+                    self.commit(join(requests_dir, file_name), entry['sha256'])
+
+    def site_finished(self, journal_shortcode):
+        '''
+        Record that a site has been published, or needed no change, and commit each file of
+        this run it was the last site of.
+        '''
+        with self._lock:
+            for file_name, file_path in list(self.batch.items()):
+                entry = self.entries[file_name]
+
+                if journal_shortcode not in entry.get('remaining', []):
+                    continue
+
+                entry['remaining'].remove(journal_shortcode)
+
+                if entry['remaining']:
+                    entry['updated_at'] = time()
+                    self.save()
+                else:
+                    self.commit(file_path, entry['sha256'])
+
+    def unfinished(self):
+        '''
+        (file path, sites still to go) for each file of this run that has not been committed.
+        '''
+        with self._lock:
+            return [(file_path, self.entries[file_name]['remaining'])
+                    for file_name, file_path in self.batch.items()
+                    if self.entries[file_name]['state'] == self.PROCESSING]
+
+    def commit(self, file_path, file_hash):
+        '''
+        Delete the request file, which has been applied, and record it as committed.
+        '''
+        with self._lock:
+            try:
+                remove(file_path)
+            except FileNotFoundError:
+                pass
+
+            entry = self.entries.setdefault(basename(file_path), {'url_shortcodes': []})
+            entry.update({'sha256': file_hash, 'state': self.COMMITTED, 'remaining': [], 'updated_at': time()})
+            self.save()
+
+    def save(self):
+        partial_checkpoint_path = f'{self.checkpoint_path}.part'
+
+        with open(partial_checkpoint_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+        replace(partial_checkpoint_path, self.checkpoint_path)
@@ -0,0 +1,72 @@
+import re
+
+from lxml import etree as et
+from lxml import html as lh
+
+from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
+
+class LinkExtractor:
+    '''
+    Pull the download, upload and publish links out of a Sitebuilder edit-site page.
+
+    Only the action buttons are looked at, using lxml's HTML parser and precompiled XPath
+    queries rather than building and searching a full BeautifulSoup tree.
+    '''
+
+    download_buttons = et.XPath(
+        "//*[contains(concat(' ', normalize-space(@class), ' '), ' btn-action ')][. = 'Download']")
+    upload_buttons = et.XPath("//input[normalize-space(@class) = 'btn-action btn-primary']")
+    publish_buttons = et.XPath("//*[normalize-space(@class) = 'btn-warning is-active']")
+
+    data_xml_pattern = re.compile(r"SiteDataCore&workflowSubType=$")
+
+    @classmethod
+    def is_download_link(cls, href, file_extension):
+        '''
+        Whether a "Download" button's href is the one for the given file type.
+        '''
+        if file_extension == "data.xml":
+            return bool(cls.data_xml_pattern.search(href))
+
+        elif file_extension != "config.xml":
+            return SitebuilderSite.file_type_sb_url_conversion[file_extension] in href
+
+        else:
+            return all(y in href for y in ['Live', 'SiteCore'])
+
+    @classmethod
+    def extract_site_links(cls, content, journal_shortcode):
+        '''
+        Build the link map for an edit-site page.
+
+        "download" maps each file type in file_type_sb_url_conversion to its download href,
+        "upload" maps each "<shortcode>_<file type>" file name to its upload data-url and
+        "publish" is the publish stub.
+        '''
+        site_links = {'download': {}, 'upload': {}, 'publish': None}
+
+        try:
+            page = lh.document_fromstring(content)
+        except (et.ParserError, ValueError):
+            return site_links
+
+        download_hrefs = [x.get("href") for x in cls.download_buttons(page)]
+        upload_urls = [x.get("data-url") for x in cls.upload_buttons(page)]
+        publish_stubs = [x.get("data-url") for x in cls.publish_buttons(page)]
+
+        # Where several buttons match, the last one on the page is used
+        for file_extension in SitebuilderSite.file_type_sb_url_conversion:
+            file_name = f"{journal_shortcode}_{file_extension}"
+
+            for href in download_hrefs:
+                if href is not None and cls.is_download_link(href, file_extension):
+                    site_links['download'][file_extension] = href
+
+            for upload_url in upload_urls:
+                if upload_url is not None and file_name in upload_url:
+                    site_links['upload'][file_name] = upload_url
+
+        if publish_stubs:
+            site_links['publish'] = publish_stubs[-1]
+
+        return site_links
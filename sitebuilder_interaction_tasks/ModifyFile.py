@@ -1,37 +1,62 @@
-from os.path import getmtime, getctime, exists
+from copy import deepcopy
 from datetime import datetime
-from time import sleep
 
 from lxml import etree as et
 from tqdm import tqdm
-import pandas as pd
-import numpy as np
 
 from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
 from sitebuilder_interaction_tasks.AutomatedContentListings import AutomatedContentListings
+from sitebuilder_interaction_tasks.SiteDocument import SiteDocument
+from sitebuilder_interaction_tasks.XPathRegistry import XPathRegistry
+from sitebuilder_interaction_tasks.StreamingEdit import StreamingEdit
 
 class ModifyFile:
     '''
     All functions to modify config, data, subscription pricing, and rankings file.
     
     This includes IF/Rankings, PPV, ACL requests, and TrendMD widget creation.
+    
+    Each method edits the site's in-memory SiteDocument; nothing is written until
+    SiteDocument.commit is called once all of a site's edits have been made.
     '''
     
+    # Top level widget XML elements for each type of ACL widget, cloned for each request
+    # with its instanceName filled in and its settings added ahead of any already there
+    magic_skeleton = (
+        et.fromstring('<Widget type="SelectableContentList" instanceName=""/>'),
+        et.fromstring('<WidgetSetting type="SelectableContentList" instanceName="" controllerName="Solr">'
+                      # Hard coded widget settings
+                      '<Setting name="ShowBasicView" value="True" type="RuntimeSetting"/>'
+                      '<Setting name="VerticalListOrientation" value="True" type="RuntimeSetting"/>'
+                      '<Setting name="BrowseAllEnable" value="False" type="RuntimeSetting"/>'
+                      '</WidgetSetting>')
+    )
+    alnp_skeletons = {
+        # Keyed by whether the widget has a combined mode list
+        True: (
+            et.fromstring('<Widget type="ArticleListNewAndPopular" instanceName=""/>'),
+            et.fromstring('<WidgetSetting type="ArticleListNewAndPopular" instanceName="" '
+                          'controllerName="OUPCache" actionName="ArticleListNewAndPopularCombinedView"/>')
+        ),
+        False: (
+            et.fromstring('<Widget type="ArticleListNewAndPopular" instanceName=""/>'),
+            et.fromstring('<WidgetSetting type="ArticleListNewAndPopular" instanceName="" '
+                          'controllerName="Article" actionName="ArticleListNewAndPopularByMode"/>')
+        )
+    }
+    
+    # Widget elements already built for an ACL request, see acl_widget
+    widget_cache = {}
+    
     @staticmethod
-    def time_since_last_file_modification(file: str):
-        file_last_modification_epoch = getmtime(file)
-        file_last_modification = datetime.fromtimestamp(file_last_modification_epoch)
-        time_since_last_modification = datetime.now() - file_last_modification
+    def empty_rankings():
+        '''
+        Root to start a rankings file from when the downloaded one is not usable.
+        '''
+        page = et.Element("category_rankings")
+        et.SubElement(page, "category")
         
-        return time_since_last_modification.seconds
-    
-    @classmethod
-    def update_from_original_or_new(cls, site: SitebuilderSite):
-        if exists(site.new_file_path) and cls.time_since_last_file_modification(site.new_file_path) < 60:
-            return site.new_file_path
-
-        else:
-            return site.original_file_path
+        return page
     
     @classmethod
     def add_top_level_widget_xml(cls, site: SitebuilderSite):
@@ -41,14 +66,12 @@ class ModifyFile:
         -Note-
         This method is rarely invoked.
         '''
-        file_path = cls.update_from_original_or_new(site)
-        tree = et.parse(file_path)           
-        root = tree.getroot()
+        root = SiteDocument.open(site).root
 
-        block_settings = root.xpath('//Location[@name="MainContent"]/Block')
-        single_page = root.xpath('//Page[@name="Home"]')
-        page_settings = root.xpath('//PageSettings')
-        site_template = root.xpath('//SiteTemplateSettings')
+        block_settings = XPathRegistry.main_content_block(root)
+        single_page = XPathRegistry.home_page(root)
+        page_settings = XPathRegistry.page_settings(root)
+        site_template = XPathRegistry.site_template_settings(root)
 
         if len(page_settings) == 0:
             settings = et.Element('PageSettings')
@@ -58,183 +81,120 @@ class ModifyFile:
             site_template_parent = site_template[0].getparent()
             site_template_parent.insert(site_template_parent.index(site_template[0])+1,
                                  settings)
-            tree.write(site.new_file_path)
 
         elif len(single_page) == 0:
             page = et.Element('Page', attrib={'name': 'Home'})
             location = et.SubElement(page, 'Location', attrib={'name': 'MainContent'})
             et.SubElement(location, 'Block')
             page_settings[0].insert(0, page)
-            tree.write(site.new_file_path)
 
         elif len(block_settings) == 0:
             location = et.Element('Location', attrib={'name': 'MainContent'})
             et.SubElement(location, 'Block')
             single_page[0].insert(0, location)
-            tree.write(site.new_file_path)
     
     @classmethod
-    def modify_xml(cls, site: SitebuilderSite):
+    def modify_xml(cls, site: SitebuilderSite, rows=None):
         '''
-        Convert the combined ACL requests list into a dictionary and create Magic/ALNP widget depending
-        on which settings have been specified.
+        Create a Magic/ALNP widget for each of the site's ACL requests.
+        
+        rows defaults to the site's requests in the working list, see
+        AutomatedContentListings.working_list_rows.
         '''
+        if rows is None:
+            rows = AutomatedContentListings.working_list_rows(site.journal_shortcode)
         
-        # For each line in acl_settings_xlsx create a dictionary
-        for d in pd.read_excel(AutomatedContentListings.acl_settings_xlsx).replace([np.nan], [None]).to_dict('records'):
-            if d.pop('url_shortcode') != site.journal_shortcode:
-                pass
-            else:
-
-                # The instance name is used to name the widget
-                instance_name = d.pop('instance_name')
-
-                try:
-                    d.pop('UserEmail')
-                except Exception as e:
-                    pass
-
-                try:
-                    d.pop('TimeRequested')
-                except Exception as e:
-                    pass
-
-                file_path = cls.update_from_original_or_new(site)
-                tree = et.parse(file_path)
-
-                root = tree.getroot()
-
-                # Location of the element to add, change, or remove
-                block = root.xpath('//Location[@name="MainContent"]/Block')
-                settings = root.xpath('//WidgetSettings')
-
-                try:
-                    if d['Mode'] in ('MostRead', 'MostCited') or d['CombinedModeList'] is not None:
-                        widget_block, widget_settings = cls.alnp_widget(d, instance_name)
-                    else:
-                        widget_block, widget_settings = cls.magic_widget(d, instance_name)
+        for request in rows:
+            root = SiteDocument.open(site).root
 
-                    success_flag = True
+            # Location of the element to add, change, or remove
+            block = XPathRegistry.main_content_block(root)
+            settings = XPathRegistry.widget_settings(root)
 
-                except:
-                    success_flag = False
-                    pass
+            widget_block, widget_settings = cls.acl_widget(request)
 
-                finally:
-                    if success_flag is False:
-                        widget_block, widget_settings = cls.magic_widget(d, instance_name)
+            # The widget is already there, e.g. when a request that was interrupted is run again
+            if any(cls.same_widget_settings(x, widget_settings)
+                   for x in XPathRegistry.widget_setting_named(root, name=request['instance_name'])):
+                tqdm.write(f"{site.journal_shortcode} already has {request['instance_name']}")
+                continue
 
-                # Insert the XML elements, including subelements, into the correct
-                # place in the existing XML file
-                try:
-                    block[0].insert(0, widget_block)
+            # Insert the XML elements, including subelements, into the correct
+            # place in the existing XML file
+            try:
+                block[0].insert(0, widget_block)
 
-                except Exception as e:
-                    tqdm.write(f'{site.journal_shortcode} - Tried to modify block 1:', str(e))
+            except Exception as e:
+                tqdm.write(f'{site.journal_shortcode} - Tried to modify block 1:', str(e))
 
-                settings[0].insert(0, widget_settings)
+            settings[0].insert(0, widget_settings)
 
-                # Write the new Tree to file
-                tree.write(site.new_file_path)
-                tqdm.write(f"{site.journal_shortcode} has been modified")
-            
+            tqdm.write(f"{site.journal_shortcode} has been modified")
+    
     @staticmethod
-    def magic_widget(d, instance_name):
+    def same_widget_settings(existing, widget_settings):
+        return (dict(existing.attrib) == dict(widget_settings.attrib)
+                and [dict(x.attrib) for x in existing] == [dict(x.attrib) for x in widget_settings])
+    
+    @classmethod
+    def acl_widget(cls, request):
         '''
-        Create magic widget based on settings dictionary.
+        Copies of the widget elements for an ACL request.
+        
+        The elements for each distinct request are built once, as the same widget is often
+        requested for many sites.
         '''
+        key = (request['widget'], request['combined'], request['instance_name'], request['settings'])
         
-        # Top level widget XML elements
-        widget_block = et.Element('Widget', attrib={'type':'SelectableContentList',
-                                                                      'instanceName':instance_name})
-
-        widget_settings = et.Element('WidgetSetting', attrib={'type':'SelectableContentList',
-                                                              'instanceName':instance_name,
-                                                              'controllerName':'Solr'})
-        # Use key/value pairs to build subelements of the
-        # widget settings from acl_settings_xlsx         
-        for k, v in d.items():
-            # If the value is NaN skip the setting
-            if pd.isnull(v):
-                continue
-            if k in ('Mode', 'ArticleListPageSize', 'NumYearsOfCitations'):
-                continue
+        if key not in cls.widget_cache:
+            if request['widget'] == 'alnp':
+                widget = cls.alnp_widget(request['settings'], request['instance_name'], request['combined'])
             else:
-                k = str(k)
-                v = str(v)
-
-                if v in ('TRUE', 'FALSE', 'true', 'false'):
-                    v = v.title()
-
-                # XML encoding of values conflicts with ElementTree therefore
-                # if '&quot;' or '&amp;' are apparent convert to standard
-                if '&quot;' in v or '&amp;' in v:
-                    v = v.replace('&quot;', '"').replace('&amp;', '&')
-                    
-                et.SubElement(widget_settings, 'Setting', attrib={'name':k,
-                                                                  'value':v,
-                                                                  'type':"RuntimeSetting"})
-
-        # Hard coded widget settings
-        et.SubElement(widget_settings, 'Setting', attrib={'name':'ShowBasicView',
-                                                              'value':'True',
-                                                              'type':"RuntimeSetting"})
-        et.SubElement(widget_settings, 'Setting', attrib={'name':'VerticalListOrientation',
-                                                              'value':'True',
-                                                              'type':"RuntimeSetting"})
-        et.SubElement(widget_settings, 'Setting', attrib={'name':'BrowseAllEnable',
-                                                              'value':'False',
+                widget = cls.magic_widget(request['settings'], request['instance_name'])
+            
+            cls.widget_cache[key] = widget
+        
+        widget_block, widget_settings = cls.widget_cache[key]
+        
+        return deepcopy(widget_block), deepcopy(widget_settings)
+    
+    @classmethod
+    def build_widget(cls, skeleton, settings, instance_name):
+        '''
+        Clone a widget skeleton and add the request's settings ahead of any already in it.
+        '''
+        widget_block, widget_settings = (deepcopy(x) for x in skeleton)
+        
+        widget_block.attrib['instanceName'] = instance_name
+        widget_settings.attrib['instanceName'] = instance_name
+        
+        skeleton_settings = list(widget_settings)
+        
+        for name, value in settings:
+            et.SubElement(widget_settings, 'Setting', attrib={'name':name,
+                                                              'value':value,
                                                               'type':"RuntimeSetting"})
         
-        return(widget_block, widget_settings)
+        # Move the skeleton's own settings after the request's
+        widget_settings.extend(skeleton_settings)
+        
+        return widget_block, widget_settings
     
-    @staticmethod
-    def alnp_widget(d, instance_name):
+    @classmethod
+    def magic_widget(cls, settings, instance_name):
         '''
-        Create ALNP widget based on settings dictionary.
+        Create magic widget from normalised (name, value) settings.
         '''
-
-        if d['CombinedModeList'] != None:
-            controller_name = 'OUPCache'
-            action_name = 'ArticleListNewAndPopularCombinedView'
-        else:
-            controller_name = 'Article'
-            action_name = 'ArticleListNewAndPopularByMode'
-
-        # Top level widget XML elements
-        widget_block = et.Element('Widget', attrib={'type':'ArticleListNewAndPopular',
-                                                    'instanceName':instance_name})
-
-        widget_settings = et.Element('WidgetSetting', attrib={'type':'ArticleListNewAndPopular',
-                                                              'instanceName':instance_name,
-                                                              'controllerName':controller_name,
-                                                              'actionName': action_name})
-
-        # Use key/value pairs to build subelements of the
-        # widget settings from acl_settings_xlsx         
-        for k, v in d.items():
-            # If the value is NaN skip the setting
-            if pd.isnull(v):
-                continue
-            # If the value is any variant of false, skip
-            elif v in ('FALSE', 'False', 'false', False):
-                continue
-            else:
-                k = str(k)
-                v = str(v)
-
-                if v in ('TRUE', 'FALSE', 'true', 'false'):
-                    v = v.title()
-
-                # XML encoding of values conflicts with  ElementTree therefore
-                # if '&quot;' or '&amp;' are apparent convert to standard
-                if '&quot;' in v or '&amp;' in v:
-                    v = v.replace('&quot;', '"').replace('&amp;', '&')
-                et.SubElement(widget_settings, 'Setting', attrib={'name':k,
-                                                                  'value':v,
-                                                                  'type':"RuntimeSetting"})
-
-        return(widget_block, widget_settings)
+        return cls.build_widget(cls.magic_skeleton, settings, instance_name)
+    
+    @classmethod
+    def alnp_widget(cls, settings, instance_name, combined):
+        '''
+        Create ALNP widget from normalised (name, value) settings.
+        
+        Widgets with a combined mode list use the combined view.
+        '''
+        return cls.build_widget(cls.alnp_skeletons[combined], settings, instance_name)
     
     @classmethod
     def trendmd_widget(cls, site: SitebuilderSite, trendmd_id: str):
@@ -242,18 +202,17 @@ class ModifyFile:
         Method to add TrendMD widgets.
         '''
         
-        file_path = cls.update_from_original_or_new(site)
-        tree = et.parse(file_path)
-        root = tree.getroot()
+        root = SiteDocument.open(site).root
 
-        right_rail = root.xpath(".//*[@name='RightRail']/Block")
-        widget_settings =  root.xpath(".//WidgetSettings")
-        related_content = root.find(".//*[@type='RelatedContent']")
-        related_pubmed = root.find(".//*[@type='RelatedPubMed']")
-        trendmd_loc = root.find(".//Block/*[@type='TrendMD']")
-        trendmd_settings = root.find(".//WidgetSettings/*[@type='TrendMD']")
+        right_rail = XPathRegistry.right_rail_block(root)
+        widget_settings = XPathRegistry.widget_settings(root)
+        related_content = XPathRegistry.first(XPathRegistry.related_content, root)
+        related_pubmed = XPathRegistry.first(XPathRegistry.related_pubmed, root)
+        trendmd_loc = XPathRegistry.first(XPathRegistry.trendmd_block_widget, root)
+        trendmd_settings = XPathRegistry.first(XPathRegistry.trendmd_widget_setting, root)
 
-        removal_list = [related_content, related_pubmed, trendmd_loc]
+        # An existing TrendMD widget is replaced rather than duplicated
+        removal_list = [related_content, related_pubmed, trendmd_loc, trendmd_settings]
 
         for x in removal_list:
             try:
@@ -286,84 +245,141 @@ class ModifyFile:
 
         right_rail[1].insert(pos, trendmd_block)
         widget_settings[0].insert(0, trendmd_settings)
+    
+    @staticmethod
+    def mark_previous_ranks(scope, ranking_year):
+        '''
+        Mark every current rank under scope that is not for ranking_year as no longer current.
+        '''
+        for ranking in XPathRegistry.current_ranks(scope):
+            if ranking.attrib['year'] != str(ranking_year):
+                ranking.attrib['current'] = 'false'
+    
+    @staticmethod
+    def add_rank(category, rank, ranking_year):
+        '''
+        Add this year's rank to a category, unless it is already there, e.g. when an update is re-run.
+        '''
+        if any(x.text == f"{rank}" for x in XPathRegistry.ranks_for_year(category, year=f"{ranking_year}")):
+            return
+
+        attributes = {
+            "current": "true",
+            "year": f"{ranking_year}"
+        }
+
+        new_ranking_element = et.Element("rank", attrib=attributes)
+        new_ranking_element.text = f"{rank}"
 
-        tree.write(site.new_file_path)
+        category.insert(1, new_ranking_element)
     
     @classmethod
-    def update_current_years_ranking(cls, site: SitebuilderSite, ranking_name, rank):
+    def new_category(cls, ranking_name, rank, ranking_year):
+        top_level_category = et.Element('category', attrib={"display_on_homepage": "false"})
+        name = et.SubElement(top_level_category, "name")
+        name.text = ranking_name
+
+        cls.add_rank(top_level_category, rank, ranking_year)
+
+        return top_level_category
+    
+    @staticmethod
+    def first_elements_by_text(scope, texts):
+        '''
+        The first element below scope, in document order, whose text is each of texts.
+        '''
+        elements = {}
         
-        file_path = cls.update_from_original_or_new(site)
+        for element in scope.iterdescendants(et.Element):
+            if element.text in texts and element.text not in elements:
+                elements[element.text] = element
         
-        error_xml = True
+        return elements
+    
+    @classmethod
+    def update_current_years_rankings(cls, site: SitebuilderSite, rankings):
+        '''
+        Add this year's rank for each (ranking name, rank) to the site's rankings in one batch.
+        
+        Previous years' ranks are marked as no longer current once, and the ranking names are
+        found in one pass over the document. A ranking name that is not there yet gets a new
+        category at the top.
+        '''
+        document = SiteDocument.open(site, empty_root=cls.empty_rankings, streamable=True)
+        ranking_year = datetime.now().year - 1
 
-        while error_xml is True:
-            try:
-                tree = et.parse(file_path)
-                error_xml = False
-                
-            except et.XMLSyntaxError as e:
-                tqdm.write(f"{site.journal_shortcode}: {e}")
+        if document.streaming_edit is not None:
+            cls.stream_rankings(site, document.streaming_edit, rankings, ranking_year)
+            return
 
-                page = et.Element("category_rankings")
-                et.SubElement(page, "category")
-                tree = et.ElementTree(page)
+        root = document.root
 
-                tree.write(file_path)
-                sleep(2)
-                
-        root = tree.getroot()
+        cls.mark_previous_ranks(root, ranking_year)
 
-        current_rank = root.xpath(f".//rank[@current='true']")
-        ranking_name_location = root.xpath(f".//*[text()='{ranking_name}']")
-        ranking_year = datetime.now().year - 1
+        ranking_names = cls.first_elements_by_text(root, {f"{ranking_name}" for ranking_name, rank in rankings})
 
-        if len(current_rank) > 0:
-            for ranking in current_rank:
-                if ranking.attrib['year'] != str(ranking_year):
-                    ranking.attrib['current'] = 'false'
+        for ranking_name, rank in rankings:
+            if f"{ranking_name}" in ranking_names:
+                cls.add_rank(ranking_names[f"{ranking_name}"].getparent(), rank, ranking_year)
 
-        attributes = {
-            "current": "true",
-            "year": f"{ranking_year}"
-        }
+            else:
+                category = cls.new_category(ranking_name, rank, ranking_year)
+                root.insert(0, category)
 
-        new_ranking_element = et.Element("rank", attrib=attributes)
-        new_ranking_element.text = f"{rank}"
+                ranking_names[f"{ranking_name}"] = category[0]
+    
+    @classmethod
+    def stream_rankings(cls, site: SitebuilderSite, streaming_edit, rankings, ranking_year):
+        '''
+        Streaming version of update_current_years_rankings, applied to each category as it is read.
+        '''
+        # Categories added earlier in this run, which are not in the original file
+        prepended_names = {}
+        for category in streaming_edit.root_prepend:
+            prepended_names.update(cls.first_elements_by_text(category, {f"{ranking_name}" for ranking_name, rank in rankings}))
 
-        if len(ranking_name_location) == 0:
-            top_level_category = et.Element('category', attrib={"display_on_homepage": "false"})
-            name = et.SubElement(top_level_category, "name")
-            name.text = ranking_name
+        found = StreamingEdit.find_texts(site.original_file_path,
+                                         {f"{ranking_name}" for ranking_name, rank in rankings})
 
-            top_level_category.insert(1, new_ranking_element)
+        # Ranking name -> ranks to add to the first category in the file holding it
+        streamed = {}
 
-            root.insert(0, top_level_category)
+        for ranking_name, rank in rankings:
+            if f"{ranking_name}" in prepended_names:
+                cls.add_rank(prepended_names[f"{ranking_name}"].getparent(), rank, ranking_year)
 
-        else:
-            ranking_name_location[0].getparent().insert(1, new_ranking_element)
+            elif f"{ranking_name}" in found:
+                streamed.setdefault(f"{ranking_name}", []).append(rank)
 
+            else:
+                category = cls.new_category(ranking_name, rank, ranking_year)
+                streaming_edit.prepend_to_root(category)
 
-        tree.write(site.new_file_path)
-        
-    @classmethod
-    def update_current_years_if(cls, site: SitebuilderSite, one_year, five_year):
-        
-        file_path = cls.update_from_original_or_new(site)
-        tree = et.parse(file_path)
-        root = tree.getroot()
-        
-        one_year = f"{float(one_year):.3f}"
-        five_year = f"{float(five_year):.3f}"
-        
-        if_year = datetime.now().year - 1
+                prepended_names[f"{ranking_name}"] = category[0]
+
+        def edit(category, occurrence):
+            cls.mark_previous_ranks(category, ranking_year)
+
+            for ranking_name, element in cls.first_elements_by_text(category, set(streamed)).items():
+                for rank in streamed.pop(ranking_name):
+                    cls.add_rank(element.getparent(), rank, ranking_year)
 
+        streaming_edit.add_edit('category', edit)
+    
+    @staticmethod
+    def add_impact_factor(scope, impact_factors, if_year, one_year, five_year, insert=True):
+        '''
+        Mark the current impact factors under scope as no longer current, unless they are for
+        if_year, and insert this year's impact factor.
+        
+        It goes beside the current impact factor, or into the first of impact_factors when there is none.
+        '''
         attributes = {
             "current": "true",
             "year": f"{if_year}"
         }
         
-        current_if = root.xpath(f".//ImpactFactor[@current='true']")
-        impact_factors = root.xpath(f".//ImpactFactors")
+        current_if = XPathRegistry.current_impact_factors(scope)
         
         if len(current_if) > 0:
             for impact_factor in current_if:
@@ -378,38 +394,145 @@ class ModifyFile:
         five_year_if_element = et.SubElement(new_if_element, "FiveYear")
         five_year_if_element.text = five_year
         
-        if len(current_if) > 0:
+        existing_if = [x for x in XPathRegistry.impact_factors_for_year(scope, year=f"{if_year}")
+                       if x.findtext("OneYear") == one_year and x.findtext("FiveYear") == five_year]
+        
+        if len(existing_if) > 0 or not insert:
+            # This year's impact factor is already there, e.g. when an update is re-run
+            pass
+        elif len(current_if) > 0:
             current_if[0].getparent().insert(0, new_if_element)
         else:
             impact_factors[0].insert(0, new_if_element)
+    
+    @staticmethod
+    def find_impact_factors(file_path, if_year, one_year, five_year):
+        '''
+        For a streamed file, read in one pass: which ImpactFactors element, by occurrence, holds the
+        first current impact factor (0 when there is none), and whether this year's impact factor
+        is already anywhere in the file, as add_impact_factor decides for the whole document.
+        '''
+        target = None
+        exists = False
         
-        tree.write(site.new_file_path)
+        # Occurrence of each open ImpactFactors element, and how many have been opened
+        open_impact_factors = []
+        occurrences = 0
         
-        @classmethod
-        def update_ppv(cls, site: SitebuilderSite, ppv_df):
-            
-            ppv_period_year = datetime.now().year
+        # Depth inside an ImpactFactor, whose children are kept until it has been checked
+        inside = 0
+        
+        for event, element in et.iterparse(file_path, events=('start', 'end'), huge_tree=True):
+            if event == 'start':
+                if element.tag == 'ImpactFactors':
+                    open_impact_factors.append(occurrences)
+                    occurrences += 1
+                elif element.tag == 'ImpactFactor':
+                    inside += 1
+                continue
             
-            file_path = cls.update_from_original_or_new(site)
-            tree = et.parse(file_path)
-            root = tree.getroot()
+            if element.tag == 'ImpactFactors':
+                open_impact_factors.pop()
             
-            gbp_currency = ppv_df[ppv_df['url_shortcode'] == site.journal_shortcode]['GBP'].values[0]
-            eur_currency = ppv_df[ppv_df['url_shortcode'] == site.journal_shortcode]['EUR'].values[0]
-            usd_currency = ppv_df[ppv_df['url_shortcode'] == site.journal_shortcode]['USD'].values[0]
+            elif element.tag == 'ImpactFactor':
+                inside -= 1
+                
+                if target is None and element.get('current') == 'true' and open_impact_factors:
+                    target = open_impact_factors[-1]
+                
+                if (element.get('year') == f"{if_year}" and element.findtext("OneYear") == one_year
+                        and element.findtext("FiveYear") == five_year):
+                    exists = True
             
-            try:    
-                prices = root.find('.//Prices')
-                price = ET.Element('Price', attrib={
-                    'priceUsd': f'{float(usd_currency):.2f}',
-                    'priceGbp': f'{float(gbp_currency):.2f}',
-                    'priceEur': f'{float(eur_currency):.2f}',
-                    'startDate': f'1/1/{ppv_period_year} 12:00:00 AM',
-                    'endDate': f'12/31/{ppv_period_year} 11:59:59 PM'})
+            if inside == 0:
+                element.clear()
+                while element.getparent() is not None and element.getprevious() is not None:
+                    del element.getparent()[0]
         
-            except Exception as e:
-                tqdm.write(f'{title}: {e}')
-            
-            prices.insert(len(prices),price)
-            
-            tree.write(site.new_file_path)
\ No newline at end of file
+        return (target if target is not None else 0), exists
+    
+    @classmethod
+    def update_current_years_if(cls, site: SitebuilderSite, one_year, five_year):
+        
+        document = SiteDocument.open(site, streamable=True)
+        
+        one_year = f"{float(one_year):.3f}"
+        five_year = f"{float(five_year):.3f}"
+        
+        if_year = datetime.now().year - 1
+
+        if document.streaming_edit is not None:
+            target, exists = cls.find_impact_factors(site.original_file_path, if_year, one_year, five_year)
+
+            # Every ImpactFactors element has its old impact factors marked, and the new one goes
+            # where it would in the whole document, unless it is there already
+            def edit(impact_factors, occurrence):
+                cls.add_impact_factor(impact_factors, [impact_factors], if_year, one_year, five_year,
+                                      insert=occurrence == target and not exists)
+
+            document.streaming_edit.add_edit('ImpactFactors', edit)
+            return
+
+        root = document.root
+        
+        cls.add_impact_factor(root, XPathRegistry.impact_factors(root), if_year, one_year, five_year)
+    
+    @staticmethod
+    def add_price(prices, attributes):
+        # This year's prices are already there, e.g. when an update is re-run
+        if any(dict(x.attrib) == attributes for x in XPathRegistry.price(prices)):
+            return
+        
+        price = et.Element('Price', attrib=attributes)
+        prices.insert(len(prices),price)
+        
+    @classmethod
+    def update_ppv(cls, site: SitebuilderSite, gbp_currency, eur_currency, usd_currency):
+        
+        ppv_period_year = datetime.now().year
+        
+        document = SiteDocument.open(site, streamable=True)
+        
+        attributes = {
+            'priceUsd': f'{float(usd_currency):.2f}',
+            'priceGbp': f'{float(gbp_currency):.2f}',
+            'priceEur': f'{float(eur_currency):.2f}',
+            'startDate': f'1/1/{ppv_period_year} 12:00:00 AM',
+            'endDate': f'12/31/{ppv_period_year} 11:59:59 PM'}
+        
+        if document.streaming_edit is not None:
+            def edit(prices, occurrence):
+                if occurrence == 0:
+                    cls.add_price(prices, attributes)
+
+            document.streaming_edit.add_edit('Prices', edit)
+            return
+        
+        cls.add_price(XPathRegistry.first(XPathRegistry.prices, document.root), attributes)
+    
+    @classmethod
+    def apply(cls, site: SitebuilderSite, operation, payload):
+        '''
+        Make one task's edits to a site's document.
+        
+        operation names the task and payload is a plain dictionary of the values it needs, so that
+        the same edits can be made in a worker process, see ModifyStage.
+        '''
+        if operation == 'acl':
+            cls.add_top_level_widget_xml(site)
+            cls.modify_xml(site, payload['rows'])
+        
+        elif operation == 'if':
+            cls.update_current_years_if(site, payload['one_year'], payload['five_year'])
+        
+        elif operation == 'rankings':
+            cls.update_current_years_rankings(site, payload['rankings'])
+        
+        elif operation == 'ppv':
+            cls.update_ppv(site, payload['gbp'], payload['eur'], payload['usd'])
+        
+        elif operation == 'trendmd':
+            cls.trendmd_widget(site, payload['trendmd_id'])
+        
+        else:
+            raise ValueError(f'Unknown modification: {operation}')
@@ -0,0 +1,95 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from os.path import getsize
+from threading import Lock
+from time import perf_counter
+
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.ConcurrentStage import ConcurrentStage
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+from sitebuilder_interaction_tasks.SiteDocument import SiteDocument
+from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
+from sitebuilder_interaction_tasks.ModifyFile import ModifyFile
+
+# Everything a worker process needs to modify one site
+ModifyWorkItem = namedtuple('ModifyWorkItem', ['journal_shortcode', 'file_extension', 'original_file_path',
+                                               'new_file_path', 'operation', 'payload', 'streaming_threshold'])
+
+class ModifyStage(ConcurrentStage):
+    '''
+    Apply a task's ModifyFile changes to each downloaded site.
+
+    work is called with the site and returns the ModifyFile.apply operation and payload for it.
+    The edits are made to the site's SiteDocument, which is then written to the site's new file
+    in one go. Sites whose new file has the same content as the original are marked no-op, which
+    keeps them out of the upload and publish stages.
+
+    With more than one process the sites are modified across a pool of worker processes, each
+    given a picklable ModifyWorkItem, and otherwise in this process.
+    '''
+
+    stage = 'modify'
+    desc = 'Modifying XML files: '
+
+    def __init__(self, work, processes=0):
+        # One thread per process keeps the pool busy without queueing work in it
+        super().__init__(max(1, processes))
+        self.work = work
+        self.processes = processes
+
+        self.executor = None
+        self._lock = Lock()
+
+    @staticmethod
+    def modify_site(site, operation, payload):
+        start = perf_counter()
+
+        ModifyFile.apply(site, operation, payload)
+
+        if not SiteDocument.commit(site):
+            tqdm.write(f"{site.journal_shortcode} is unchanged, skipping upload and publish")
+
+            return SiteResult(site.journal_shortcode, 'modify', SiteResult.NO_OP,
+                              latency=perf_counter() - start)
+
+        return SiteResult(site.journal_shortcode, 'modify', SiteResult.OK,
+                          bytes=getsize(site.new_file_path), latency=perf_counter() - start)
+
+    @classmethod
+    def modify_work_item(cls, item):
+        '''
+        Run in a worker process: rebuild the site from the work item and modify it.
+        '''
+        site = SitebuilderSite(item.journal_shortcode, item.file_extension)
+        site.original_file_path = item.original_file_path
+        site.new_file_path = item.new_file_path
+
+        SiteDocument.streaming_threshold = item.streaming_threshold
+
+        return cls.modify_site(site, item.operation, item.payload)
+
+    def get_executor(self):
+        with self._lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+        return self.executor
+
+    def process(self, site):
+        tqdm.write(f"Modifying {site.journal_shortcode}")
+
+        operation, payload = self.work(site)
+
+        if self.processes > 1:
+            item = ModifyWorkItem(site.journal_shortcode, site.file_extension, site.original_file_path,
+                                  site.new_file_path, operation, payload, SiteDocument.streaming_threshold)
+
+            return self.get_executor().submit(self.modify_work_item, item).result()
+
+        return self.modify_site(site, operation, payload)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
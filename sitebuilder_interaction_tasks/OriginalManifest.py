@@ -0,0 +1,104 @@
+import json
+from hashlib import sha256
+from os import replace
+from os.path import basename, exists, getsize, join
+from threading import Lock
+from time import time
+
+class OriginalManifest:
+    '''
+    Record of the files downloaded into the "original" folder, kept beside them as manifest.json.
+
+    Each entry holds the fetch time, size and SHA-256 of the file along with any ETag or
+    Last-Modified validators Sitebuilder sent, so a later run can reuse the file instead of
+    downloading it again.
+    '''
+
+    manifest_file_name = 'manifest.json'
+
+    def __init__(self, directory):
+        self.manifest_path = join(directory, self.manifest_file_name)
+        self._lock = Lock()
+
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def file_hash(file_path):
+        digest = sha256()
+
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def get(self, file_path):
+        '''
+        The file's entry, or None if it is not recorded or the file on disk no longer matches it.
+        '''
+        entry = self.entries.get(basename(file_path))
+
+        if entry is None or not exists(file_path) or getsize(file_path) != entry['size']:
+            return None
+
+        if self.file_hash(file_path) != entry['sha256']:
+            return None
+
+        return entry
+
+    def is_fresh(self, file_path, ttl):
+        entry = self.get(file_path)
+
+        return entry is not None and time() - entry['fetched_at'] < ttl
+
+    def conditional_headers(self, file_path):
+        '''
+        Request headers that let Sitebuilder answer 304 Not Modified if the file has not changed.
+        '''
+        entry = self.get(file_path)
+        headers = {}
+
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def record(self, file_path, size, file_hash, response=None):
+        entry = {
+            'fetched_at': time(),
+            'size': size,
+            'sha256': file_hash,
+            'etag': None,
+            'last_modified': None
+        }
+
+        if response is not None:
+            entry['etag'] = response.headers.get('ETag')
+            entry['last_modified'] = response.headers.get('Last-Modified')
+
+        with self._lock:
+            self.entries[basename(file_path)] = entry
+            self.save()
+
+    def touch(self, file_path):
+        '''
+        Mark an unchanged file as fetched now, e.g. after a 304 Not Modified.
+        '''
+        with self._lock:
+            self.entries[basename(file_path)]['fetched_at'] = time()
+            self.save()
+
+    def save(self):
+        partial_manifest_path = f'{self.manifest_path}.part'
+
+        with open(partial_manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+        replace(partial_manifest_path, self.manifest_path)
@@ -0,0 +1,71 @@
+from time import perf_counter, sleep
+
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.ConcurrentStage import ConcurrentStage
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+from sitebuilder_interaction_tasks.SitebuilderInteraction import SitebuilderInteraction
+
+class PublishStage(ConcurrentStage):
+    '''
+    Publish each uploaded site to live and wait until Sitebuilder reports it has finished.
+
+    Each worker submits one publish and polls that site's edit-site page, so the number of
+    publishes in flight is bounded by the worker count and each finishes as soon as
+    Sitebuilder does, rather than after a fixed sleep.
+    '''
+
+    stage = 'publish'
+    desc = 'Publishing site to live: '
+
+    # Seconds; the poll interval starts at poll_interval and grows by poll_backoff up to max_poll_interval
+    poll_interval = 1
+    poll_backoff = 1.5
+    max_poll_interval = 15
+
+    # Seconds to wait for a publish to finish before giving up on it
+    publish_timeout = 600
+
+    def wait_until_published(self, site):
+        '''
+        Poll until the site is live, returning False if publish_timeout passes first.
+        '''
+        start = perf_counter()
+        interval = self.poll_interval
+
+        while perf_counter() - start < self.publish_timeout:
+            sleep(interval)
+
+            if SitebuilderInteraction.is_published(site):
+                return True
+
+            interval = min(self.max_poll_interval, interval * self.poll_backoff)
+
+        return False
+
+    def process(self, site):
+        start = perf_counter()
+
+        result = SitebuilderInteraction.publish_to_live(site)
+
+        if not result.ok:
+            return result
+
+        if self.wait_until_published(site):
+            result.latency = perf_counter() - start
+            tqdm.write(f'{site.journal_shortcode}: live after {result.latency:.1f}s')
+
+        else:
+            result = SiteResult(site.journal_shortcode, self.stage, SiteResult.ERROR,
+                                latency=perf_counter() - start,
+                                error=f'not live after {self.publish_timeout}s')
+            tqdm.write(f'{site.journal_shortcode}: {result.error}')
+
+        return result
+
+    def summarise(self, results):
+        super().summarise(results)
+
+        for result in results:
+            if result.ok:
+                tqdm.write(f'{result.journal_shortcode}: time to publish {result.latency:.1f}s')
@@ -0,0 +1,204 @@
+import json
+import pickle
+import sqlite3
+from os import makedirs
+from os.path import abspath, dirname, exists, join
+from threading import Lock
+from time import time
+
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.OriginalManifest import OriginalManifest
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+
+class RunJournal:
+    '''
+    SQLite journal of how far each site of a run got through its stages, so that an
+    interrupted run can be resumed from where each site stopped, see TerminalUI.resume_run.
+
+    A run has the same id as its SnapshotStore run. When it starts, each site is recorded with
+    its file paths and the ModifyFile.apply operation and payload it was given; as each site
+    finishes a stage, the stage's status is recorded with the time and the SHA-256 of the file
+    the stage left behind.
+    '''
+
+    journal_path = join(abspath(""), 'snapshots', 'journal.sqlite')
+
+    # The file each stage leaves behind for the next
+    stage_files = {
+        'download': 'original_file_path',
+        'modify': 'new_file_path',
+        'upload': 'new_file_path'
+    }
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY,
+            task TEXT NOT NULL,
+            publish INTEGER NOT NULL,
+            stages TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS sites (
+            run_id INTEGER NOT NULL,
+            journal_shortcode TEXT NOT NULL,
+            file_extension TEXT NOT NULL,
+            original_file_path TEXT NOT NULL,
+            new_file_path TEXT NOT NULL,
+            work BLOB,
+            PRIMARY KEY (run_id, journal_shortcode)
+        );
+        CREATE TABLE IF NOT EXISTS site_stages (
+            run_id INTEGER NOT NULL,
+            journal_shortcode TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            file_hash TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (run_id, journal_shortcode, stage)
+        );
+    '''
+
+    def __init__(self, journal_path=None):
+        self.journal_path = journal_path or self.journal_path
+        makedirs(dirname(self.journal_path), exist_ok=True)
+
+        # Stages record results from their worker threads, one at a time
+        self.connection = sqlite3.connect(self.journal_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(self.schema)
+        self._lock = Lock()
+
+        # The run being recorded, see start_run and resume_run
+        self.run_id = None
+
+    def start_run(self, run_id, task, publish, stages, sites, work=None):
+        '''
+        Record a new run of the named stages over the sites, with each site's work if it is modified.
+        '''
+        with self._lock, self.connection:
+            for table in ('runs', 'sites', 'site_stages'):
+                self.connection.execute(f'DELETE FROM {table} WHERE run_id = ?', (run_id,))
+
+            self.connection.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, NULL)',
+                                    (run_id, task, int(publish), json.dumps(stages), time()))
+
+            self.connection.executemany('INSERT INTO sites VALUES (?, ?, ?, ?, ?, ?)', [
+                (run_id, site.journal_shortcode, site.file_extension, site.original_file_path,
+                 site.new_file_path, pickle.dumps(work(site)) if work is not None else None)
+                for site in sites
+            ])
+
+        self.run_id = run_id
+
+    def resume_run(self, run_id):
+        with self._lock, self.connection:
+            self.connection.execute('UPDATE runs SET finished_at = NULL WHERE run_id = ?', (run_id,))
+
+        self.run_id = run_id
+
+    def record(self, site, result):
+        '''
+        Record the site's result for a stage of the current run.
+        '''
+        if self.run_id is None:
+            return
+
+        file_hash = None
+        file_path = getattr(site, self.stage_files.get(result.stage, ''), None)
+
+        if result.ok and file_path is not None and exists(file_path):
+            file_hash = OriginalManifest.file_hash(file_path)
+
+        try:
+            with self._lock, self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO site_stages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (self.run_id, site.journal_shortcode, result.stage, result.status,
+                                         file_hash, result.error, result.attempts, time()))
+
+        except sqlite3.Error as e:
+            tqdm.write(f"{site.journal_shortcode}: could not record the {result.stage} stage in the run journal: {e}")
+
+    def finish_run(self):
+        if self.run_id is not None:
+            with self._lock, self.connection:
+                self.connection.execute('UPDATE runs SET finished_at = ? WHERE run_id = ?', (time(), self.run_id))
+
+            self.run_id = None
+
+    def run_ids(self):
+        return [x for x, in self.connection.execute('SELECT run_id FROM runs ORDER BY run_id')]
+
+    def load_run(self, run_id):
+        '''
+        The run, with each of its sites' file paths, work and the state of each stage it reached.
+        '''
+        task, publish, stages, started_at, finished_at = self.connection.execute(
+            'SELECT task, publish, stages, started_at, finished_at FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+
+        sites = {}
+
+        for journal_shortcode, file_extension, original_file_path, new_file_path, work in self.connection.execute(
+                'SELECT journal_shortcode, file_extension, original_file_path, new_file_path, work '
+                'FROM sites WHERE run_id = ? ORDER BY rowid', (run_id,)):
+            sites[journal_shortcode] = {
+                'file_extension': file_extension,
+                'original_file_path': original_file_path,
+                'new_file_path': new_file_path,
+                'work': pickle.loads(work) if work is not None else None,
+                'stages': {}
+            }
+
+        for journal_shortcode, stage, status, file_hash, updated_at in self.connection.execute(
+                'SELECT journal_shortcode, stage, status, file_hash, updated_at FROM site_stages WHERE run_id = ?',
+                (run_id,)):
+            sites[journal_shortcode]['stages'][stage] = {'status': status, 'file_hash': file_hash,
+                                                         'updated_at': updated_at}
+
+        return {'run_id': run_id, 'task': task, 'publish': bool(publish), 'stages': json.loads(stages),
+                'started_at': started_at, 'finished_at': finished_at, 'sites': sites}
+
+    def resume_stage(self, site, stages, states, snapshots=None):
+        '''
+        Index of the first of the stages the site still has to go through, or None if it has finished.
+
+        The file the last finished stage left behind must be as it was then. If it has changed or
+        gone it is restored from the snapshots where possible, otherwise that stage is done again.
+        '''
+        index = 0
+
+        for name in stages:
+            state = states.get(name)
+
+            if state is not None and state['status'] == SiteResult.NO_OP:
+                return None
+
+            if state is None or state['status'] != SiteResult.OK:
+                break
+
+            index += 1
+
+        while 0 < index < len(stages):
+            name = stages[index - 1]
+
+            # Publishing needs nothing from the upload
+            if name == 'upload':
+                break
+
+            file_path = getattr(site, self.stage_files[name])
+            file_hash = states[name]['file_hash']
+
+            if file_hash is not None:
+                if exists(file_path) and OriginalManifest.file_hash(file_path) == file_hash:
+                    break
+
+                if snapshots is not None and exists(snapshots.object_path(file_hash)):
+                    snapshots.extract(file_hash, file_path)
+                    break
+
+            index -= 1
+
+        return index if index < len(stages) else None
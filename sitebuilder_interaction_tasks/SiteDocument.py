@@ -0,0 +1,88 @@
+from os.path import getsize
+
+from lxml import etree as et
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.FileToUpdate import FileToUpdate
+from sitebuilder_interaction_tasks.XPathRegistry import XPathRegistry
+from sitebuilder_interaction_tasks.StreamingEdit import StreamingEdit
+from sitebuilder_interaction_tasks.FileComparison import FileComparison
+
+class SiteDocument:
+    '''
+    A site's XML file parsed once from the "original" folder, edited in memory by any number
+    of ModifyFile methods and written once to the "new" folder on commit.
+
+    Files of at least streaming_threshold bytes whose edits only add to or adjust part of the
+    document, and that declare no namespaces, are not parsed at all; their edits are collected
+    in a StreamingEdit and applied while the file is copied on commit.
+    '''
+
+    # Bytes; None parses every file whole
+    streaming_threshold = None
+
+    def __init__(self, site: FileToUpdate, empty_root=None, streaming=False):
+        self.site = site
+        self.tree = None
+        self.root = None
+        self.streaming_edit = None
+
+        if streaming:
+            self.streaming_edit = StreamingEdit()
+            return
+
+        try:
+            self.tree = et.parse(site.original_file_path, XPathRegistry.parser)
+
+        except et.XMLSyntaxError as e:
+            # Some files, e.g. an empty rankings file, can be started from scratch
+            if empty_root is None:
+                raise
+
+            tqdm.write(f"{site.journal_shortcode}: {e}")
+            self.tree = et.ElementTree(empty_root())
+
+        self.root = self.tree.getroot()
+
+    @classmethod
+    def open(cls, site: FileToUpdate, empty_root=None, streamable=False):
+        '''
+        The site's document, parsed on first use.
+
+        empty_root, if given, is called to build the root element when the original file
+        is not well-formed XML. streamable edits can work on a streamed document, whose
+        streaming_edit is set instead of tree and root.
+        '''
+        if site.document is None:
+            streaming = (streamable and cls.streaming_threshold is not None
+                         and getsize(site.original_file_path) >= cls.streaming_threshold
+                         and not StreamingEdit.declares_namespaces(site.original_file_path))
+
+            site.document = cls(site, empty_root, streaming)
+
+        elif site.document.streaming_edit is not None and not streamable:
+            raise ValueError(f"{site.journal_shortcode}: this edit needs the whole document, "
+                             "which is being streamed")
+
+        return site.document
+
+    @classmethod
+    def commit(cls, site: FileToUpdate):
+        '''
+        Write the site's document, with every edit made to it, to the site's new file, and
+        return whether the new file differs from the original.
+
+        A streamed document differs if any of its edits changed it, so neither file has to be
+        parsed; otherwise the files are compared, see FileComparison.
+        '''
+        document = site.document or cls.open(site)
+        site.document = None
+
+        if document.streaming_edit is not None:
+            document.streaming_edit.rewrite(site.original_file_path, site.new_file_path)
+
+            return document.streaming_edit.changed
+
+        document.tree.write(site.new_file_path)
+
+        return not FileComparison.is_unchanged(site)
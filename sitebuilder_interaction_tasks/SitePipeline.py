@@ -0,0 +1,122 @@
+import sys
+from queue import Queue
+from threading import Lock, Thread
+
+from tqdm import tqdm
+
+class SitePipeline:
+    '''
+    Move each site through a sequence of stages on its own, rather than waiting for every
+    site to finish one stage before any site starts the next.
+
+    Stages are ConcurrentStage objects, each with its own pool of worker threads, joined by
+    bounded queues. A site only enters a stage once its previous stage succeeded, so the
+    per-site order (download, modify, upload, publish) is unchanged; a site that fails a
+    stage is dropped from the stages after it.
+    '''
+
+    # Sites allowed to wait between two stages, per worker in the stage they are waiting for
+    queue_size_per_worker = 2
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.queues = [Queue(maxsize=self.queue_size_per_worker * stage.workers) for stage in stages]
+
+        self.results = {}
+        self._lock = Lock()
+
+        # Queue depth seen each time a site joins a stage's queue
+        self.max_depth = [0 for stage in stages]
+        self.total_depth = [0 for stage in stages]
+        self.puts = [0 for stage in stages]
+
+    def put(self, index, site):
+        self.queues[index].put(site)
+
+        depth = self.queues[index].qsize()
+
+        with self._lock:
+            self.max_depth[index] = max(self.max_depth[index], depth)
+            self.total_depth[index] += depth
+            self.puts[index] += 1
+
+    def feed(self, sites, start):
+        for site in sites:
+            self.put(start.get(site.journal_shortcode, 0), site)
+
+        for i in range(self.stages[0].workers):
+            self.queues[0].put(None)
+
+    def work(self, index, progress):
+        stage = self.stages[index]
+
+        while True:
+            site = self.queues[index].get()
+
+            if site is None:
+                break
+
+            result = stage.process_safely(site)
+
+            with self._lock:
+                self.results[site.journal_shortcode].append(result)
+
+            progress.update()
+
+            if result.ok and index + 1 < len(self.stages):
+                self.put(index + 1, site)
+
+    def close_stage(self, index, workers):
+        '''
+        Once every worker of a stage has finished, tell the next stage there is nothing more to come.
+        '''
+        for worker in workers:
+            worker.join()
+
+        if index + 1 < len(self.stages):
+            for i in range(self.stages[index + 1].workers):
+                self.queues[index + 1].put(None)
+
+    def run(self, sites, start=None):
+        '''
+        Return each site's SiteResults, one per stage it reached, keyed by journal shortcode.
+
+        start gives the index of the stage a site starts at, when resuming a run, otherwise
+        every site starts at the first stage.
+        '''
+        sites = list(sites)
+        start = start or {}
+        self.results = {site.journal_shortcode: [] for site in sites}
+
+        progress_bars = [tqdm(total=sum(start.get(site.journal_shortcode, 0) <= i for site in sites),
+                              desc=stage.desc, position=i, leave=True, file=sys.stdout)
+                         for i, stage in enumerate(self.stages)]
+
+        threads = [Thread(target=self.feed, args=(sites, start), daemon=True)]
+
+        for index, stage in enumerate(self.stages):
+            workers = [Thread(target=self.work, args=(index, progress_bars[index]), daemon=True)
+                       for i in range(stage.workers)]
+            threads.extend(workers)
+            threads.append(Thread(target=self.close_stage, args=(index, workers), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        for progress in progress_bars:
+            progress.close()
+
+        return self.results
+
+    def summarise(self, results):
+        for index, stage in enumerate(self.stages):
+            stage_results = [site_results[index] for site_results in results.values()
+                             if len(site_results) > index]
+            stage.summarise(stage_results)
+
+            mean_depth = self.total_depth[index] / self.puts[index] if self.puts[index] else 0
+            tqdm.write(f'{stage.desc}queue depth max {self.max_depth[index]}, mean {mean_depth:.1f} '
+                       f'(limit {self.queues[index].maxsize})')
@@ -0,0 +1,32 @@
+class SiteResult:
+    '''
+    Outcome of one stage (download, upload, etc.) for one Sitebuilder site.
+    '''
+
+    OK = 'ok'
+    NOT_FOUND = 'not found'
+    ERROR = 'error'
+
+    # The modified file is the same as the original so there is nothing to upload or publish
+    NO_OP = 'no-op'
+
+    def __init__(self, journal_shortcode, stage, status, bytes=0, latency=0.0, error=None,
+                 retryable=False, attempts=1):
+        self.journal_shortcode = journal_shortcode
+        self.stage = stage
+        self.status = status
+        self.bytes = bytes
+        self.latency = latency
+        self.error = error
+
+        # Whether trying the stage again could succeed, e.g. after a timeout
+        self.retryable = retryable
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.status == self.OK
+
+    def __repr__(self):
+        return (f'SiteResult({self.journal_shortcode!r}, {self.stage!r}, {self.status!r}, '
+                f'bytes={self.bytes}, latency={self.latency:.2f}, attempts={self.attempts})')
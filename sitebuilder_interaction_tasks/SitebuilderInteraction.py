@@ -1,4 +1,8 @@
-import re
+from os import remove, replace
+from os.path import dirname, getsize
+from hashlib import sha256
+from threading import Lock
+from time import perf_counter
 
 import requests
 from tqdm import tqdm
@@ -6,6 +10,10 @@ from bs4 import BeautifulSoup as bs
 
 from sitebuilder_secrets import username, password
 from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
+from sitebuilder_interaction_tasks.SitebuilderSession import SitebuilderSession
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+from sitebuilder_interaction_tasks.LinkExtractor import LinkExtractor
+from sitebuilder_interaction_tasks.OriginalManifest import OriginalManifest
 
 class SitebuilderInteraction(SitebuilderSite):
     '''
@@ -28,120 +36,281 @@ class SitebuilderInteraction(SitebuilderSite):
         ") Chrome/79.0.3945.130 Safari/537.36"
     }
     
+    download_chunk_size = 64 * 1024
+    
+    # Seconds a previously downloaded original file may be reused for without asking Sitebuilder,
+    # None always downloads. Once stale, the file is still reused if Sitebuilder reports it unchanged.
+    reuse_ttl = None
+    
+    # Record of the files in the "original" folder, loaded on first download
+    manifest = None
+    _manifest_lock = Lock()
+    
+    # Shared by every stage until end_session is called at the end of a run
+    session = None
+    
+    # Snapshots of the files downloaded and uploaded in the current run, None keeps no snapshots
+    snapshots = None
+    
     @classmethod
     def get_session(cls):
-        s = requests.session()
-        s.headers.update(cls.headers)
-        s.post(f'{cls.sitebuilder_root}/sign-in', data=cls.login_creds)
+        if cls.session is None:
+            cls.session = SitebuilderSession(cls.sitebuilder_root, cls.headers, cls.login_creds)
         
-        return s
+        return cls.session
     
-    @staticmethod
-    def get_data(site: SitebuilderSite, exception_list, count):
+    @classmethod
+    def end_session(cls):
+        '''
+        Report the logins and connections used by the run, close the shared session and
+        finish the run's snapshots.
+        '''
+        if cls.session is not None:
+            cls.session.report()
+            cls.session.close()
+            cls.session = None
+        
+        if cls.snapshots is not None:
+            cls.snapshots.finish_run()
+    
+    @classmethod
+    def get_site_links(cls, site: SitebuilderSite, refresh=False):
+        '''
+        Fetch the site's edit-site page on first use and memoise its link map on the site.
+        '''
+        if site.site_links is None or refresh:
+            html = cls.get_session().get(site.site_url)
+            site.site_links = LinkExtractor.extract_site_links(html.content, site.journal_shortcode)
 
-        http_session = SitebuilderInteraction.get_session()
+        return site.site_links
+    
+    @classmethod
+    def record_snapshot(cls, site: SitebuilderSite, stage, file_path, file_hash=None):
+        '''
+        Keep a snapshot of the file for the current run, see SnapshotStore.
         
-        count += 1
+        A snapshot that cannot be written is reported but does not fail the site.
+        '''
+        if cls.snapshots is None:
+            return
+
+        try:
+            cls.snapshots.record(site, stage, file_path, file_hash)
 
-        tqdm.write(f"{count}: {site.journal_shortcode}")
+        except OSError as e:
+            tqdm.write(f"{site.journal_shortcode}: could not keep a snapshot of {file_path}: {e}")
+    
+    @classmethod
+    def get_manifest(cls, site: SitebuilderSite):
+        with cls._manifest_lock:
+            if cls.manifest is None:
+                cls.manifest = OriginalManifest(dirname(site.original_file_path))
+
+        return cls.manifest
+    
+    @staticmethod
+    def get_data(site: SitebuilderSite):
+        '''
+        Download the site's file into the "original" folder and return a SiteResult.
+        '''
+        http_session = SitebuilderInteraction.get_session()
+        manifest = SitebuilderInteraction.get_manifest(site)
+        reuse_ttl = SitebuilderInteraction.reuse_ttl
+        start = perf_counter()
 
-        html = http_session.get(site.site_url)
-        soup = bs(html.content, 'html.parser')
+        if reuse_ttl is not None and manifest.is_fresh(site.original_file_path, reuse_ttl):
+            tqdm.write(f"Reusing: {site.journal_shortcode}, downloaded within the last {reuse_ttl}s")
+            SitebuilderInteraction.record_snapshot(site, 'downloaded', site.original_file_path)
 
-        if site.file_extension == "data.xml":
-            p = re.compile(r"SiteDataCore&workflowSubType=$")
+            return SiteResult(site.journal_shortcode, 'download', SiteResult.OK,
+                              latency=perf_counter() - start)
 
-            for x in soup.find_all(attrs={"class": "btn-action"}, text="Download"):
-                href = x.get("href")
-                match = re.findall(p, x.get("href"))
-                if match:
-                    file_url_stub = href
+        tqdm.write(f"Downloading: {site.journal_shortcode}")
 
-        elif site.file_extension != "config.xml":
-            for x in soup.find_all(attrs={"class": "btn-action"}, text="Download"):
-                href = x.get("href")
-                if site.file_type_sb_url_conversion[site.file_extension] in href:
-                    file_url_stub = href
+        site_links = SitebuilderInteraction.get_site_links(site)
+        file_url_stub = site_links['download'].get(site.file_extension)
+
+        if file_url_stub is None:
+            tqdm.write(f"\n{site.journal_shortcode} could not be found")
 
-        else:
-            for x in soup.find_all(attrs={"class": "btn-action"}, text="Download"):
-                href = x.get("href")
-                if all(y in x.get('href') for y in ['Live', 'SiteCore']):
-                    file_url_stub = href
+            return SiteResult(site.journal_shortcode, 'download', SiteResult.NOT_FOUND,
+                              latency=perf_counter() - start)
         
         try:
             file_site_location = site.sitebuilder_root + file_url_stub
-            file_contents = http_session.get(file_site_location)
-            text = file_contents.text
             
-            # Site builder was giving XML that contained random characters which
-            # was stopping the XML parser from reading the file as it did not begin
-            # with "<"
-            while text[0] != "<":
-                text = text[1:]
+            if reuse_ttl is not None:
+                validators = manifest.conditional_headers(site.original_file_path)
+            else:
+                validators = {}
+
+            file_contents = http_session.get(file_site_location, stream=True, headers=validators)
+
+            if validators and file_contents.status_code == 304:
+                file_contents.close()
+                manifest.touch(site.original_file_path)
+                tqdm.write(f"Reusing: {site.journal_shortcode}, unchanged on Sitebuilder")
+                SitebuilderInteraction.record_snapshot(site, 'downloaded', site.original_file_path)
+
+                return SiteResult(site.journal_shortcode, 'download', SiteResult.OK,
+                                  latency=perf_counter() - start)
+
+            size, file_hash = SitebuilderInteraction.stream_to_file(file_contents, site.original_file_path)
+            manifest.record(site.original_file_path, size, file_hash, file_contents)
+            SitebuilderInteraction.record_snapshot(site, 'downloaded', site.original_file_path, file_hash)
                         
         except Exception as e:
             tqdm.write(str(e))
             tqdm.write(f"\n{site.journal_shortcode} could not be found")
-            exception_list.append(site.journal_shortcode)
             
-            return(exception_list, count)
+            return SiteResult(site.journal_shortcode, 'download', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=str(e))
+
+        return SiteResult(site.journal_shortcode, 'download', SiteResult.OK,
+                          bytes=size, latency=perf_counter() - start)
+    
+    @classmethod
+    def stream_to_file(cls, response, file_path):
+        '''
+        Write a streamed response to file_path in chunks, as the bytes Sitebuilder sent,
+        and return the number of bytes written and their SHA-256.
+        
+        Site builder was giving XML that contained random characters which
+        was stopping the XML parser from reading the file as it did not begin
+        with "<", so everything before the first "<" is skipped.
+        '''
+        partial_file_path = f"{file_path}.part"
+        xml_started = False
+        size = 0
+        digest = sha256()
+
+        with response, open(partial_file_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=cls.download_chunk_size):
+                if not xml_started:
+                    xml_start = chunk.find(b"<")
+
+                    if xml_start == -1:
+                        continue
+
+                    chunk = chunk[xml_start:]
+                    xml_started = True
 
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
 
-        with open(site.original_file_path, "w+", encoding="utf-8") as f:
-            f.write(text)
-            f.close()
+        if not xml_started:
+            remove(partial_file_path)
+            raise ValueError(f"No XML found in {response.url}")
 
-        return(exception_list, count)
+        replace(partial_file_path, file_path)
+
+        return size, digest.hexdigest()
+    
+    @classmethod
+    def is_retryable_status(cls, status_code):
+        '''
+        Server errors and rate limiting are worth retrying, other client errors are not.
+        '''
+        return status_code >= 500 or status_code == 429
     
     @classmethod
     def post_xml(cls, site: SitebuilderSite):
-
+        '''
+        Upload the site's modified file and return a SiteResult marking whether a failure is retryable.
+        '''
         http_session = cls.get_session()
+        start = perf_counter()
         
         file_name = f"{site.journal_shortcode}_{site.file_extension}"
         
-        file_to_upload = {file_name: open(site.new_file_path, 'rb')}
+        # Reading the edit-site page for the upload location can fail like the upload itself
+        try:
+            upload_location = cls.get_site_links(site)['upload'].get(file_name)
 
-        html = http_session.get(site.site_url)
-        html_soup = bs(html.content, 'html.parser')
-        
-        for x in html_soup.find_all("input", attrs={"class": "btn-action btn-primary"}):
-            if file_name in x.get("data-url"):
-                upload_location = x.get("data-url")
-        
-        tqdm.write(f"{site.journal_shortcode}: Uploading to - {site.sitebuilder_root}{upload_location}")
+            if upload_location is None:
+                tqdm.write(f"{site.journal_shortcode}: no upload location found for {file_name}\n")
+                return SiteResult(site.journal_shortcode, 'upload', SiteResult.NOT_FOUND,
+                                  latency=perf_counter() - start)
+            
+            tqdm.write(f"{site.journal_shortcode}: Uploading to - {site.sitebuilder_root}{upload_location}")
+
+            with open(site.new_file_path, 'rb') as f:
+                upload_xml = http_session.post(f"{site.sitebuilder_root}{upload_location}", files={file_name: f}, timeout=240)
+
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            tqdm.write(f"{site.journal_shortcode} could not be reached: {e}\n")
+            return SiteResult(site.journal_shortcode, 'upload', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=str(e), retryable=True)
 
-        try:
-            upload_xml = http_session.post(f"{site.sitebuilder_root}{upload_location}", files=file_to_upload, timeout=240)
-            upload_soup = bs(upload_xml.content, 'html.parser')
-            tqdm.write(f"{site.journal_shortcode}: {upload_soup}\n")
-            return 0
         except Exception as e:
             tqdm.write(f"{site.journal_shortcode} could not be found: {e}\n")
-            return 1
+            return SiteResult(site.journal_shortcode, 'upload', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=str(e))
+
+        if upload_xml.status_code >= 400:
+            error = f"HTTP {upload_xml.status_code}"
+            tqdm.write(f"{site.journal_shortcode}: upload failed with {error}\n")
+            return SiteResult(site.journal_shortcode, 'upload', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=error,
+                              retryable=cls.is_retryable_status(upload_xml.status_code))
+
+        upload_soup = bs(upload_xml.content, 'html.parser')
+        tqdm.write(f"{site.journal_shortcode}: {upload_soup}\n")
+        
+        cls.record_snapshot(site, 'uploaded', site.new_file_path)
+
+        return SiteResult(site.journal_shortcode, 'upload', SiteResult.OK,
+                          bytes=getsize(site.new_file_path), latency=perf_counter() - start)
         
     @classmethod
     def publish_to_live(cls, site: SitebuilderSite):
+        '''
+        Ask Sitebuilder to publish the site to live and return a SiteResult.
+
+        This only submits the publish, see is_published for whether it has finished.
+        '''
         http_session = cls.get_session()
+        start = perf_counter()
 
-        html = http_session.get(site.site_url)
-        soup = bs(html.content, 'html.parser')
-        
-        for x in soup.find_all(class_='btn-warning is-active'):
-            publish_site_stub = x.get('data-url')
+        publish_site_stub = cls.get_site_links(site)['publish']
+
+        # The publish button is only active once there are changes to publish, so if it
+        # was missing when the page was first read, read it again now
+        if publish_site_stub is None:
+            publish_site_stub = cls.get_site_links(site, refresh=True)['publish']
+
+        if publish_site_stub is None:
+            tqdm.write(f'{site.journal_shortcode}: no publish button found')
+            return SiteResult(site.journal_shortcode, 'publish', SiteResult.NOT_FOUND,
+                              latency=perf_counter() - start)
 
         try:
             publish_page = http_session.post(f"{site.sitebuilder_root}{publish_site_stub}")
-            soup = bs(publish_page.content, 'html.parser')
-            tqdm.write(f'{site.journal_shortcode}: {soup.prettify()}')
-            return 0
+
         except Exception as e:
-            tqdm.write(str(e))
-            return 1
+            tqdm.write(f'{site.journal_shortcode}: {e}')
+            return SiteResult(site.journal_shortcode, 'publish', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=str(e),
+                              retryable=isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)))
 
-        time_to_wait = 3
-        
-        tqdm.write(f'{site.journal_shortcode} published, waiting {time_to_wait} seconds to complete.')
+        if publish_page.status_code >= 400:
+            error = f"HTTP {publish_page.status_code}"
+            tqdm.write(f'{site.journal_shortcode}: publish failed with {error}')
+            return SiteResult(site.journal_shortcode, 'publish', SiteResult.ERROR,
+                              latency=perf_counter() - start, error=error,
+                              retryable=cls.is_retryable_status(publish_page.status_code))
+
+        tqdm.write(f'{site.journal_shortcode}: publish requested')
+
+        return SiteResult(site.journal_shortcode, 'publish', SiteResult.OK, latency=perf_counter() - start)
+    
+    @classmethod
+    def is_published(cls, site: SitebuilderSite):
+        '''
+        Whether the site has finished publishing, read from a fresh copy of its edit-site page.
 
-        time.sleep(time_to_wait)
+        The "btn-warning is-active" publish button stays active while there are changes that
+        are not yet live, so the site is live once the button is no longer active.
+        '''
+        return cls.get_site_links(site, refresh=True)['publish'] is None
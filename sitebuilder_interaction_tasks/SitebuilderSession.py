@@ -0,0 +1,103 @@
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+class SitebuilderSession:
+    '''
+    One authenticated Sitebuilder session shared by every stage of a run.
+
+    Logs in lazily on first use and again only when Sitebuilder redirects a request
+    back to the sign-in page, i.e. when the login has expired.
+    '''
+
+    sign_in_stub = '/sign-in'
+
+    # Keep-alive connections held open per host
+    pool_size = 16
+
+    def __init__(self, sitebuilder_root, headers, login_creds):
+        self.sitebuilder_root = sitebuilder_root
+        self.headers = headers
+        self.login_creds = login_creds
+
+        self.login_count = 0
+        self.request_count = 0
+        self._lock = Lock()
+
+        self.http_session = requests.session()
+        self.http_session.headers.update(self.headers)
+
+        self.adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.http_session.mount('https://', self.adapter)
+        self.http_session.mount('http://', self.adapter)
+
+    def login(self, seen_login_count=None):
+        '''
+        Sign in, unless another thread has signed in since the caller saw seen_login_count.
+        '''
+        with self._lock:
+            if seen_login_count is not None and self.login_count != seen_login_count:
+                return
+
+            self.http_session.post(f'{self.sitebuilder_root}{self.sign_in_stub}', data=self.login_creds)
+            self.login_count += 1
+
+    def send(self, method, url, **kwargs):
+        '''
+        Send the request, returning the response and the login count it was sent with.
+        '''
+        login_count = self.login_count
+        response = self.http_session.request(method, url, **kwargs)
+
+        with self._lock:
+            self.request_count += 1
+
+        return response, login_count
+
+    def is_sign_in_redirect(self, response):
+        '''
+        Sitebuilder answers requests made with an expired login by redirecting to the sign-in page.
+        '''
+        return bool(response.history) and self.sign_in_stub in response.url
+
+    def request(self, method, url, **kwargs):
+        if self.login_count == 0:
+            self.login(0)
+
+        response, login_count = self.send(method, url, **kwargs)
+
+        if self.is_sign_in_redirect(response):
+            tqdm.write(f'Sitebuilder login expired, signing in again: {url}')
+            self.login(login_count)
+
+            # Uploaded files have already been read once so rewind them before retrying
+            for f in (kwargs.get('files') or {}).values():
+                if hasattr(f, 'seek'):
+                    f.seek(0)
+
+            response, login_count = self.send(method, url, **kwargs)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def connection_count(self):
+        '''
+        Number of connections opened by the pooled adapter over the life of the session.
+        '''
+        pools = self.adapter.poolmanager.pools
+
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def report(self):
+        tqdm.write(f'Sitebuilder session: {self.login_count} login(s), '
+                   f'{self.connection_count()} connection(s), {self.request_count} request(s)')
+
+    def close(self):
+        self.http_session.close()
@@ -21,3 +21,6 @@ class SitebuilderSite(FileToUpdate):
             self.site_url = f"{self.sitebuilder_root}/edit-site?publishingid=f60a5800-41b4-48a1-8cb9-8aafe7624b45"
         else:
             self.site_url = f"{self.sitebuilder_root}/edit-site?urlprefix={self.journal_shortcode}"
+        
+        # Download, upload and publish links from the edit-site page, fetched once per run
+        self.site_links = None
@@ -0,0 +1,139 @@
+import gzip
+import json
+from glob import glob
+from os import makedirs, replace
+from os.path import abspath, basename, dirname, exists, join, splitext
+from shutil import copyfileobj
+from threading import Lock, get_ident
+from time import time
+
+from sitebuilder_interaction_tasks.OriginalManifest import OriginalManifest
+
+class SnapshotStore:
+    '''
+    Compressed copies of every file downloaded from and uploaded to Sitebuilder, kept in the
+    "snapshots" folder so that any run can be rolled back.
+
+    Files are stored once each under the SHA-256 of their content, gzipped, in "objects"; a
+    file that has not changed since an earlier run takes no more space. Each run writes
+    runs/<run id>.json, recording the snapshot of each site's file as downloaded before the
+    run and as uploaded by it.
+    '''
+
+    snapshots_dir = join(abspath(""), 'snapshots')
+
+    def __init__(self, directory=None):
+        self.directory = directory or self.snapshots_dir
+        self.objects_dir = join(self.directory, 'objects')
+        self.runs_dir = join(self.directory, 'runs')
+
+        makedirs(self.objects_dir, exist_ok=True)
+        makedirs(self.runs_dir, exist_ok=True)
+
+        # The run being recorded, see start_run
+        self.run = None
+        self._lock = Lock()
+
+    def object_path(self, file_hash):
+        return join(self.objects_dir, file_hash[:2], f'{file_hash}.gz')
+
+    def store(self, file_path, file_hash=None):
+        '''
+        Add the file's content to the store, unless it is already there, and return its SHA-256.
+        '''
+        if file_hash is None:
+            file_hash = OriginalManifest.file_hash(file_path)
+
+        object_path = self.object_path(file_hash)
+
+        if not exists(object_path):
+            makedirs(dirname(object_path), exist_ok=True)
+
+            # Another thread may be storing the same content
+            partial_object_path = f'{object_path}.{get_ident()}.part'
+
+            with open(file_path, 'rb') as f, gzip.open(partial_object_path, 'wb') as g:
+                copyfileobj(f, g)
+
+            replace(partial_object_path, object_path)
+
+        return file_hash
+
+    def extract(self, file_hash, file_path):
+        '''
+        Write the stored content with the given SHA-256 to file_path.
+        '''
+        partial_file_path = f'{file_path}.part'
+
+        with gzip.open(self.object_path(file_hash), 'rb') as g, open(partial_file_path, 'wb') as f:
+            copyfileobj(g, f)
+
+        replace(partial_file_path, file_path)
+
+    def run_ids(self):
+        return sorted(int(splitext(basename(x))[0]) for x in glob(join(self.runs_dir, '*.json')))
+
+    def run_path(self, run_id):
+        return join(self.runs_dir, f'{run_id}.json')
+
+    def load_run(self, run_id):
+        with open(self.run_path(run_id), encoding='utf-8') as f:
+            return json.load(f)
+
+    def start_run(self, task, publish=False):
+        run_ids = self.run_ids()
+
+        self.run = {
+            'run_id': run_ids[-1] + 1 if run_ids else 1,
+            'task': task,
+            'publish': publish,
+            'started_at': time(),
+            'finished_at': None,
+            'files': {}
+        }
+        self.save_run()
+
+        return self.run['run_id']
+
+    def resume_run(self, run_id):
+        '''
+        Carry on recording an earlier run, see RunJournal.
+        '''
+        self.run = self.load_run(run_id)
+        self.run['finished_at'] = None
+        self.save_run()
+
+    def record(self, site, stage, file_path, file_hash=None):
+        '''
+        Store the file and record it as the site's file for the stage ('downloaded' or
+        'uploaded') in the current run.
+        '''
+        if self.run is None:
+            return
+
+        file_hash = self.store(file_path, file_hash)
+
+        with self._lock:
+            entry = self.run['files'].setdefault(f'{site.journal_shortcode}_{site.file_extension}', {
+                'journal_shortcode': site.journal_shortcode,
+                'file_extension': site.file_extension
+            })
+            entry[stage] = file_hash
+
+            self.save_run()
+
+    def finish_run(self):
+        if self.run is not None:
+            with self._lock:
+                self.run['finished_at'] = time()
+                self.save_run()
+                self.run = None
+
+    def save_run(self):
+        run_path = self.run_path(self.run['run_id'])
+        partial_run_path = f'{run_path}.part'
+
+        with open(partial_run_path, 'w', encoding='utf-8') as f:
+            json.dump(self.run, f, indent=1, sort_keys=True)
+
+        replace(partial_run_path, run_path)
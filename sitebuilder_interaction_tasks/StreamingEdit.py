@@ -0,0 +1,201 @@
+from os import remove, replace
+from os.path import exists
+
+from lxml import etree as et
+
+class StreamingEdit:
+    '''
+    Copy an XML file element by element with iterparse and xmlfile, editing only chosen anchors.
+
+    Only the anchor elements being edited (e.g. ImpactFactors or Prices) and the chain of
+    their open ancestors are held in memory. Everything else is written out as soon as it has
+    been read, so peak memory does not grow with the size of the document.
+
+    Each subtree is written on its own, which would declare an ancestor's namespaces again on
+    every one of them, so documents that declare namespaces are not streamed, see
+    declares_namespaces.
+    '''
+
+    def __init__(self):
+        # Anchor tag -> edit functions called with each anchor element and its occurrence number
+        self.edits = {}
+
+        # Elements to insert as the first children of the root
+        self.root_prepend = []
+
+        self.occurrences = {}
+
+        # Whether any edit, or an element prepended to the root, changed the document
+        self.changed = False
+
+    def add_edit(self, anchor_tag, edit):
+        self.edits.setdefault(anchor_tag, []).append(edit)
+
+    def prepend_to_root(self, element):
+        self.root_prepend.insert(0, element)
+
+    @staticmethod
+    def declares_namespaces(file_path):
+        '''
+        Whether the file may declare an XML namespace, i.e. contains "xmlns" anywhere, read in chunks.
+        '''
+        marker = b'xmlns'
+        previous = b''
+
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                # Keep the end of the last chunk in case the marker spans two
+                if marker in previous + chunk:
+                    return True
+
+                previous = chunk[-(len(marker) - 1):]
+
+        return False
+
+    @staticmethod
+    def find_texts(file_path, texts):
+        '''
+        Which of the given texts are the text of some element in the file, read in one streaming pass.
+        '''
+        found = set()
+
+        for event, element in et.iterparse(file_path, events=('end',), huge_tree=True):
+            if element.text in texts:
+                found.add(element.text)
+
+            # Drop the element, and the siblings already read before it, so memory stays flat
+            element.clear()
+            while element.getparent() is not None and element.getprevious() is not None:
+                del element.getparent()[0]
+
+        return found
+
+    def apply_edits(self, element):
+        occurrence = self.occurrences.get(element.tag, 0)
+        self.occurrences[element.tag] = occurrence + 1
+
+        # Anchors are small, so comparing them is much cheaper than comparing the files
+        before = et.tostring(element)
+
+        for edit in self.edits[element.tag]:
+            edit(element, occurrence)
+
+        if et.tostring(element) != before:
+            self.changed = True
+
+    def rewrite(self, source_path, target_path):
+        '''
+        Copy the source file to target_path with the edits made. Nothing is left at target_path
+        if the copy fails part way.
+        '''
+        partial_target_path = f'{target_path}.part'
+
+        try:
+            self.stream(source_path, partial_target_path)
+        except BaseException:
+            if exists(partial_target_path):
+                remove(partial_target_path)
+            raise
+
+        replace(partial_target_path, target_path)
+
+    def stream(self, source_path, target_path):
+        # Open elements from the root down: [element, xmlfile context or None until opened,
+        # last child written whose tail is still to come]
+        stack = []
+
+        # While inside an anchor its descendants are left to be written with it
+        anchor = None
+
+        # Comments and processing instructions after the root, which xmlfile cannot write
+        trailing = []
+        root_written = False
+
+        if self.root_prepend:
+            self.changed = True
+
+        def open_parent():
+            parent = stack[-1]
+
+            if parent[1] is None:
+                element = parent[0]
+
+                parent[1] = xf.element(element.tag, dict(element.attrib))
+                parent[1].__enter__()
+
+                if element.text:
+                    xf.write(element.text)
+
+                if element.getparent() is None:
+                    for prepended in self.root_prepend:
+                        xf.write(prepended, with_tail=False)
+
+            flush_tail(parent)
+
+        def flush_tail(parent):
+            written = parent[2]
+
+            if written is not None:
+                if written.tail:
+                    xf.write(written.tail)
+
+                # Free the written sibling now that nothing more will be read into it
+                parent[0].remove(written)
+                parent[2] = None
+
+        def write_node(node):
+            if stack:
+                open_parent()
+                xf.write(node, with_tail=False)
+                stack[-1][2] = node
+            else:
+                xf.write(node, with_tail=False)
+
+        with open(target_path, 'wb') as f:
+            with et.xmlfile(f) as xf:
+                for event, node in et.iterparse(source_path, events=('start', 'end', 'comment', 'pi'),
+                                                huge_tree=True):
+                    if anchor is not None:
+                        if event == 'end' and node is anchor:
+                            stack.pop()
+                            self.apply_edits(node)
+                            write_node(node)
+                            anchor = None
+                        continue
+
+                    if event in ('comment', 'pi'):
+                        if root_written:
+                            trailing.append(node)
+                        else:
+                            write_node(node)
+
+                    elif event == 'start':
+                        if stack:
+                            open_parent()
+
+                        stack.append([node, None, None])
+
+                        if node.tag in self.edits:
+                            anchor = node
+
+                    else:
+                        element, context, written = stack.pop()
+
+                        if context is None:
+                            if element.getparent() is None:
+                                for prepended in reversed(self.root_prepend):
+                                    element.insert(0, prepended)
+
+                            write_node(element)
+
+                        else:
+                            flush_tail([element, context, written])
+                            context.__exit__(None, None, None)
+
+                            if stack:
+                                stack[-1][2] = element
+
+                        root_written = not stack
+
+            for node in trailing:
+                f.write(et.tostring(node, with_tail=False))
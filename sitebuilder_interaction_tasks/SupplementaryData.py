@@ -0,0 +1,123 @@
+from collections import namedtuple
+from os.path import abspath, join
+
+import pandas as pd
+
+# Typed records for each site in the supplementary data CSVs
+ImpactFactors = namedtuple('ImpactFactors', ['one_year', 'five_year'])
+Ranking = namedtuple('Ranking', ['category', 'rank'])
+Prices = namedtuple('Prices', ['gbp', 'eur', 'usd'])
+TrendMD = namedtuple('TrendMD', ['trendmd_id'])
+
+# How each task's CSV is laid out, see the README
+DataFormat = namedtuple('DataFormat', ['file_name', 'record', 'columns', 'numeric', 'fill_missing', 'key'])
+
+class SupplementaryData:
+    '''
+    A task's supplementary data CSV from the "data" folder, read and checked once.
+
+    Every row is checked for missing or non-numeric values and duplicates in one pass over the
+    columns. Rows that pass become typed records looked up by url_shortcode; rows that do not
+    are kept in bad_rows, with the CSV line number and the problem, to report before any site
+    is downloaded.
+    '''
+
+    data_dir = join(abspath(""), 'data')
+
+    formats = {
+        # Empty impact factors are written as 0
+        'if': DataFormat('if.csv', ImpactFactors, ['One year', 'Five year'],
+                         numeric=['One year', 'Five year'], fill_missing='0', key=['url_shortcode']),
+        # A site can have several rankings, but only one for each category
+        'rankings': DataFormat('rankings.csv', Ranking, ['Ranking Category', 'Ranking'],
+                               numeric=[], fill_missing=None, key=['url_shortcode', 'Ranking Category']),
+        'ppv': DataFormat('ppv.csv', Prices, ['GBP', 'EUR', 'USD'],
+                          numeric=['GBP', 'EUR', 'USD'], fill_missing=None, key=['url_shortcode']),
+        'trendmd': DataFormat('trendmd.csv', TrendMD, ['id'],
+                              numeric=[], fill_missing=None, key=['url_shortcode'])
+    }
+
+    def __init__(self, task):
+        self.task = task
+        self.data_format = self.formats[task]
+        self.file_path = join(self.data_dir, self.data_format.file_name)
+
+        # url_shortcode -> record, or a list of records for rankings, in the order of the CSV
+        self.records = {}
+        self.bad_rows = pd.DataFrame(columns=['line', 'url_shortcode', 'problem'])
+
+    @property
+    def many(self):
+        return len(self.data_format.key) > 1
+
+    def load(self):
+        '''
+        Read and check the CSV.
+
+        Raises ValueError if a required column is missing, as none of the rows can be used.
+        '''
+        data_format = self.data_format
+
+        # Read everything as text so that ids and ranks are used exactly as written
+        df = pd.read_csv(self.file_path, dtype=str)
+
+        missing_columns = [x for x in ['url_shortcode'] + data_format.columns if x not in df.columns]
+        if missing_columns:
+            raise ValueError(f"{data_format.file_name} is missing the column(s): {', '.join(missing_columns)}")
+
+        df = df[['url_shortcode'] + data_format.columns].apply(lambda x: x.str.strip())
+
+        if data_format.fill_missing is not None:
+            df[data_format.columns] = df[data_format.columns].fillna(data_format.fill_missing)
+
+        numbers = df[data_format.numeric].apply(pd.to_numeric, errors='coerce').astype(float)
+
+        # (rows, problem) in the order they are checked; each row is reported for its first problem
+        checks = [(df['url_shortcode'].isna(), "missing url_shortcode")]
+
+        for column in data_format.columns:
+            checks.append((df[column].isna(), f"missing {column}"))
+
+            if column in data_format.numeric:
+                checks.append((df[column].notna() & numbers[column].isna(), f"{column} is not a number"))
+
+        problem = pd.Series(None, index=df.index, dtype=object)
+        for rows, message in reversed(checks):
+            problem = problem.mask(rows, message)
+
+        # Only rows that can otherwise be used count as duplicates
+        usable = problem.isna()
+        duplicate = usable & df[usable].duplicated(data_format.key).reindex(df.index, fill_value=False)
+        problem = problem.mask(duplicate, f"duplicate {' and '.join(data_format.key)}, the first row is used")
+
+        bad = problem.notna()
+
+        self.bad_rows = pd.DataFrame({'line': df.index[bad] + 2,
+                                      'url_shortcode': df['url_shortcode'][bad],
+                                      'problem': problem[bad]})
+
+        good = df[~bad]
+        values = [numbers[x][~bad].tolist() if x in data_format.numeric else good[x].tolist()
+                  for x in data_format.columns]
+
+        self.records = {}
+
+        for url_shortcode, *row in zip(good['url_shortcode'], *values):
+            record = data_format.record(*row)
+
+            if self.many:
+                self.records.setdefault(url_shortcode, []).append(record)
+            else:
+                self.records[url_shortcode] = record
+
+        return self
+
+    def report(self):
+        '''
+        Text listing the bad rows, if there are any.
+        '''
+        if len(self.bad_rows) == 0:
+            return ''
+
+        return (f"{len(self.bad_rows)} row(s) of {self.data_format.file_name} cannot be used: -\n\n"
+                f"{self.bad_rows.to_string(index=False)}")
@@ -16,15 +16,25 @@
 # +
 import sys
 from os.path import abspath, exists, join
-from os import mkdir, listdir
+from os import mkdir, makedirs, listdir
+from time import localtime, strftime
 
-from tqdm import tqdm, trange
-import pandas as pd
-
-from sitebuilder_interaction_tasks.ModifyFile import ModifyFile
 from sitebuilder_interaction_tasks.AutomatedContentListings import AutomatedContentListings
 from sitebuilder_interaction_tasks.SitebuilderSite import SitebuilderSite
 from sitebuilder_interaction_tasks.SitebuilderInteraction import SitebuilderInteraction
+from sitebuilder_interaction_tasks.DownloadStage import DownloadStage
+from sitebuilder_interaction_tasks.ModifyStage import ModifyStage
+from sitebuilder_interaction_tasks.UploadStage import UploadStage
+from sitebuilder_interaction_tasks.PublishStage import PublishStage
+from sitebuilder_interaction_tasks.SitePipeline import SitePipeline
+from sitebuilder_interaction_tasks.SiteDocument import SiteDocument
+from sitebuilder_interaction_tasks.SupplementaryData import SupplementaryData
+from sitebuilder_interaction_tasks.FleetDiff import FleetDiff
+from sitebuilder_interaction_tasks.SnapshotStore import SnapshotStore
+from sitebuilder_interaction_tasks.IngestCheckpoint import IngestCheckpoint
+from sitebuilder_interaction_tasks.SiteResult import SiteResult
+from sitebuilder_interaction_tasks.ConcurrentStage import ConcurrentStage
+from sitebuilder_interaction_tasks.RunJournal import RunJournal
 
 class TerminalUI:
     '''
@@ -33,14 +43,38 @@ class TerminalUI:
     
     current_dir = abspath("")
     
-    def __init__(self):
+    def __init__(self, workers=1, pipeline=False, reuse_ttl=None, processes=0, stream_threshold=None,
+                 review=False, monthly_archive=False, resume=None):
+        # Number of sites downloaded, uploaded or published concurrently, 1 keeps the
+        # original one-at-a-time behaviour
+        self.workers = workers
+        self.pipeline = pipeline
+        
+        # Number of worker processes modifying XML files, 0 modifies them in this process
+        self.processes = processes
+        
+        # Report the changes to the modified files and ask before uploading them
+        self.review = review
+        
+        # Id of an interrupted run to carry on with before showing the menu
+        self.resume = resume
+        
+        SitebuilderInteraction.reuse_ttl = reuse_ttl
+        
+        # Files of at least this many bytes are edited as they are streamed rather than parsed whole
+        SiteDocument.streaming_threshold = stream_threshold
+        
+        AutomatedContentListings.monthly_archive = monthly_archive
+        
         self.choices = {
             "1": self.acl_creation,
             "2": self.update_if,
             "3": self.update_rankings,
             "4": self.update_ppv,
             "5": self.add_trendmd_widget,
-            "6": self.quit
+            "6": self.review_changes,
+            "7": self.restore_run,
+            "8": self.quit
         }
     
     
@@ -74,7 +108,9 @@ class TerminalUI:
             3. Update Rankings
             4. Update PPV
             5. Add TrendMD widget
-            6. Quit program            
+            6. Review changes between the "original" and "new" folders
+            7. Roll back an earlier run
+            8. Quit program            
             ''')
             
         else:
@@ -97,6 +133,9 @@ class TerminalUI:
             
     def run(self):
         self.create_file_structure()
+        
+        if self.resume is not None:
+            self.resume_run(self.resume)
                      
         while True:
             self.display_menu()
@@ -111,64 +150,270 @@ class TerminalUI:
                 print("\n\n")
                 print(f"{choice} is not a valid choice.")
     
+    def process_sites(self, task, sites, work, publish=False):
+        '''
+        Download, modify, upload and optionally publish each site.
+        
+        work returns the ModifyFile.apply operation and payload for a site. The files
+        downloaded and uploaded are kept as snapshots of a run for the task, see restore_run.
+        '''
+        names = ['download', 'modify', 'upload'] + (['publish'] if publish else [])
+        stages = self.build_stages(names, work)
+        
+        self.start_run(task, publish, sites, stages, work)
+        
+        return self.run_stages(sites, stages)
+    
+    def build_stages(self, names, work=None):
+        stages = {
+            'download': lambda: DownloadStage(self.workers),
+            'modify': lambda: ModifyStage(work, self.processes),
+            'upload': lambda: UploadStage(self.workers),
+            'publish': lambda: PublishStage(self.workers)
+        }
+        
+        return [stages[name]() for name in names]
+    
     @staticmethod
-    def acl_creation():
+    def start_run(task, publish, sites, stages, work=None):
+        '''
+        Start keeping snapshots of the files downloaded and uploaded, and a journal of each
+        site's progress, for a new run.
+        '''
+        SitebuilderInteraction.snapshots = SnapshotStore()
+        run_id = SitebuilderInteraction.snapshots.start_run(task, publish)
+        
+        ConcurrentStage.journal = RunJournal()
+        ConcurrentStage.journal.start_run(run_id, task, publish, [x.stage for x in stages], sites, work)
+        
+        print(f"\nRun {run_id}: the files downloaded and uploaded are kept in {SnapshotStore.snapshots_dir}, "
+              f"run with --resume {run_id} to carry on if it is interrupted\n")
+        
+        return run_id
+    
+    def run_stages(self, sites, stages, start=None):
+        '''
+        Run each site through the stages and return its SiteResults, one per stage it reached,
+        keyed by journal shortcode.
+        
+        By default each stage finishes for every site before the next stage starts. With
+        pipeline set, each site moves through the stages on its own, unless the changes are
+        to be reviewed before uploading. start gives the index of the stage a site starts at,
+        when resuming a run, otherwise every site starts at the first stage.
+        '''
+        start = start or {}
+        
+        if self.pipeline and not self.review:
+            pipeline = SitePipeline(stages)
+            site_results = pipeline.run(sites, start)
+            pipeline.summarise(site_results)
+        
+        else:
+            all_sites = sites
+            site_results = {site.journal_shortcode: [] for site in sites}
+            passed = set()
+            
+            for index, stage in enumerate(stages):
+                # Only sites that made it through the last stage, or start at this one, go on
+                sites = [site for site in all_sites if site.journal_shortcode in passed
+                         or start.get(site.journal_shortcode, 0) == index]
+                
+                results = stage.run(sites)
+                stage.summarise(results)
+                
+                for site, result in zip(sites, results):
+                    site_results[site.journal_shortcode].append(result)
+                
+                passed = {site.journal_shortcode for site, result in zip(sites, results) if result.ok}
+                
+                if self.review and isinstance(stage, ModifyStage) and passed:
+                    self.review_changes([site for site in sites if site.journal_shortcode in passed])
+                    
+                    if input("Press \"q\" followed by enter to stop without uploading or any key to continue") == "q":
+                        break
+        
+        for stage in stages:
+            stage.close()
+        
+        SitebuilderInteraction.end_session()
+        
+        if ConcurrentStage.journal is not None:
+            ConcurrentStage.journal.finish_run()
+            ConcurrentStage.journal = None
+        
+        ConcurrentStage.on_result = None
+        
+        return site_results
+    
+    @staticmethod
+    def commit_acl_requests(checkpoint):
+        '''
+        Commit each ACL request, see IngestCheckpoint, as soon as the last of its sites is
+        published or needs no change.
+        '''
+        def on_result(site, result):
+            if result.status == SiteResult.NO_OP or (result.ok and result.stage == 'publish'):
+                checkpoint.site_finished(site.journal_shortcode)
+        
+        ConcurrentStage.on_result = on_result
+    
+    def resume_run(self, run_id):
+        '''
+        Carry on with an interrupted run, taking each site on from the last stage it finished.
+        '''
+        journal = RunJournal()
+        
+        if run_id not in journal.run_ids():
+            print(f"\n\nThere is no run {run_id} to resume.\n")
+            return
+        
+        run = journal.load_run(run_id)
+        snapshots = SnapshotStore()
+        
+        sites = []
+        start = {}
+        
+        for journal_shortcode, entry in run['sites'].items():
+            site = SitebuilderSite(journal_shortcode, entry['file_extension'])
+            site.original_file_path = entry['original_file_path']
+            site.new_file_path = entry['new_file_path']
+            
+            index = journal.resume_stage(site, run['stages'], entry['stages'], snapshots)
+            
+            if index is not None:
+                sites.append(site)
+                start[journal_shortcode] = index
+        
+        print(f"\n\nRun {run_id}, {run['task']}: {len(run['sites']) - len(sites)} of {len(run['sites'])} site(s) "
+              "finished already\n")
+        
+        for index, name in enumerate(run['stages']):
+            resuming = [x for x, i in start.items() if i == index]
+            
+            if resuming:
+                print(f"Resuming from {name}: {', '.join(resuming)}")
+        
+        if not sites:
+            return
+        
+        def work(site):
+            return run['sites'][site.journal_shortcode]['work']
+        
+        stages = self.build_stages(run['stages'], work)
+        
+        if run['task'] == 'acl':
+            checkpoint = IngestCheckpoint()
+            checkpoint.resume(AutomatedContentListings.acl_requests_dir)
+            self.commit_acl_requests(checkpoint)
+        
+        SitebuilderInteraction.snapshots = snapshots
+        
+        if run_id in snapshots.run_ids():
+            snapshots.resume_run(run_id)
+        
+        ConcurrentStage.journal = journal
+        journal.resume_run(run_id)
+        
+        return self.run_stages(sites, stages, start)
+    
+    def review_changes(self, sites=None):
+        '''
+        Compare each site's new file, or every file in the "new" folder, with its original and
+        write the report to the "diff" folder.
+        '''
+        if sites is None:
+            pairs = FleetDiff.folder_pairs(join(self.current_dir, 'original'), join(self.current_dir, 'new'))
+        else:
+            pairs = [(site.original_file_path, site.new_file_path) for site in sites]
+        
+        fleet_diff = FleetDiff(self.processes or None)
+        fleet_diff.summarise(fleet_diff.run(pairs))
+    
+    def restore_run(self):
+        '''
+        Roll back an earlier run by uploading, and publishing if the run did, the files it
+        changed as they were before it, from its snapshots.
+        '''
+        snapshots = SnapshotStore()
+        run_ids = snapshots.run_ids()
+        
+        if not run_ids:
+            print("\n\nThere are no runs to restore.\n")
+            return
+        
+        print("\n\nRecent runs: -\n")
+        
+        for run_id in run_ids[-10:]:
+            run = snapshots.load_run(run_id)
+            uploaded = sum('uploaded' in x for x in run['files'].values())
+            
+            print(f"{run_id}. {run['task']}, started {strftime('%d/%m/%Y %H:%M', localtime(run['started_at']))}, "
+                  f"{uploaded} file(s) uploaded")
+        
+        choice = input("\nEnter the number of the run to roll back, or press enter to go back: ")
+        
+        if not choice.isdigit() or int(choice) not in run_ids:
+            if choice:
+                print(f"{choice} is not a run.")
+            return
+        
+        run = snapshots.load_run(int(choice))
+        restore_dir = join(self.current_dir, 'restore', str(run['run_id']))
+        makedirs(restore_dir, exist_ok=True)
+        
+        sites = []
+        
+        # Only the files the run uploaded were changed on Sitebuilder
+        for file_name, entry in run['files'].items():
+            if 'uploaded' in entry and 'downloaded' in entry:
+                site = SitebuilderSite(entry['journal_shortcode'], entry['file_extension'])
+                site.new_file_path = join(restore_dir, file_name)
+                snapshots.extract(entry['downloaded'], site.new_file_path)
+                
+                sites.append(site)
+        
+        stages = self.build_stages(['upload'] + (['publish'] if run['publish'] else []))
+        
+        self.start_run(f"restore run {run['run_id']}", run['publish'], sites, stages)
+        
+        self.run_stages(sites, stages)
+    
+    def acl_creation(self):
         acl = AutomatedContentListings()
         acl.check_share_locations_exist()
 
-        for file in listdir(acl.acl_requests_dir):
-            acl.combine_acl_lists(file)
+        # Only requests that are new, or were not finished by an earlier run, are picked up
+        checkpoint = IngestCheckpoint()
+        requests = acl.combine_acl_lists(listdir(acl.acl_requests_dir), checkpoint)
+        
+        if not requests:
+            print("\n\nThere are no new ACL requests.\n")
+            return
 
         acl.create_working_list_and_archive_dataframe(acl.combined_acl_requests_df)
-
-        for journal in acl.combined_acl_requests_df['url_shortcode']:
-            SitebuilderSite(journal, "config.xml")
-
-        exception_list = []
-        count = 0
-        for journal in tqdm(SitebuilderSite.files_dict,
-                          desc='Downloading XML files: ',
-                          position=0, leave=True,
-                          file = sys.stdout):
-            exception_list, count = SitebuilderInteraction.get_data(SitebuilderSite.files_dict[journal], exception_list, count)
-
-        for journal in tqdm(SitebuilderSite.files_dict,
-                          desc='Modifying XML files: ',
-                          position=0, leave=True,
-                          file = sys.stdout):
-    
-            site = SitebuilderSite.files_dict[journal]
         
-            tqdm.write(f"Modifying {site.journal_shortcode}")
+        for request in requests:
+            checkpoint.mark_processing(request.file_path, request.file_hash,
+                                       set(request.acl_settings_df['url_shortcode'].dropna()))
 
-            ModifyFile.add_top_level_widget_xml(site)
-            ModifyFile.modify_xml(site)
+        sites = [SitebuilderSite(journal, "config.xml")
+                 for journal in dict.fromkeys(acl.combined_acl_requests_df['url_shortcode'].dropna())]
 
-        for journal in tqdm(SitebuilderSite.files_dict,
-                          desc='Posting XML files to Sitebuilder: ',
-                          position=0, leave=True,
-                          file = sys.stdout):
+        def work(site):
+            return 'acl', {'rows': acl.working_list_rows(site.journal_shortcode)}
 
-            site = SitebuilderSite.files_dict[journal]
-
-            try:
-                count = 0
-                while count < 5 & SitebuilderInteraction.post_xml(site) != 0:
-                    count += 1
-
-            except Exception as e:
-                tqdm.write(f'Unable to post XML: {site.journal_shortcode}: {e}')
-
-        for journal in tqdm(SitebuilderSite.files_dict,
-                          desc='Publishing site to live: ',
-                          position=0, leave=True,
-                          file = sys.stdout):
-            SitebuilderInteraction.publish_to_live(SitebuilderSite.files_dict[journal])
+        # Each request is removed as soon as all of its sites are done, the rest are picked up next time
+        self.commit_acl_requests(checkpoint)
+        self.process_sites('acl', sites, work, publish=True)
+        
+        for file_path, journal_shortcodes in checkpoint.unfinished():
+            print(f"{file_path} was not finished for {', '.join(journal_shortcodes)} "
+                  "and will be picked up by the next run")
         
-        acl_df = pd.read_excel(acl.acl_settings_xlsx)
+        acl.get_working_list()
 
         email_recipients = set()
-        [email_recipients.add(x) for x in acl_df['UserEmail'] if "could not" not in x]
+        [email_recipients.add(x) for x in acl.working_list_df['UserEmail'] if "could not" not in x]
 
         email_string = ''
 
@@ -178,10 +423,13 @@ class TerminalUI:
             else:
                 email_string += x
 
-        print(f"\nACLs have been created for the following users: - \n\n{email_string}"
-              "\n\nEmail them to confirm the creation of their ACLs along with the Archive ACL spreadsheet for this run.")
+        # The spreadsheet is needed for the emails
+        acl.wait_for_exports()
         
-        acl.delete_all_acls()
+        spreadsheet = acl.acl_settings_xlsx if acl.monthly_archive else acl.acl_archive_file
+
+        print(f"\nACLs have been created for the following users: - \n\n{email_string}"
+              f"\n\nEmail them to confirm the creation of their ACLs along with the ACL spreadsheet for this run ({spreadsheet}).")
     
     @staticmethod
     def confirm_data_file_structure():
@@ -216,52 +464,44 @@ class TerminalUI:
         
         ''')
     
+    def load_supplementary_data(self, task):
+        '''
+        Read and check a task's data CSV before any site is downloaded.
+        
+        Returns None if the file cannot be used, or if it has bad rows and the user
+        chooses not to go on without them.
+        '''
+        try:
+            data = SupplementaryData(task).load()
+        
+        except (OSError, ValueError) as e:
+            print(f"\n\n{e}\n")
+            return None
+        
+        if len(data.bad_rows) > 0:
+            print(f"\n\n{data.report()}\n")
+            
+            if input("Press \"q\" followed by enter to exit or any key to continue without these rows") == "q":
+                return None
+        
+        return data
+    
     def update_if(self):
         while True:
             self.confirm_data_file_structure()
             
             if input("Press \"q\" followed by enter to exit or any key to continue") != "q":
-                count = 0
-                exception_list = []
-                if_df = pd.read_csv(join(self.current_dir, "data", "if.csv"))
-                no_na_if_df = if_df.fillna(0)
+                data = self.load_supplementary_data('if')
                 
-                for journal in tqdm(no_na_if_df['url_shortcode'],
-                                  desc='Downloading XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-
-                    new_site = SitebuilderSite(journal, "data.xml")
-                    exception_list, count = SitebuilderInteraction.get_data(new_site, exception_list, count)
+                if data is not None:
+                    sites = [SitebuilderSite(journal, "data.xml") for journal in data.records]
 
-                for journal in tqdm(SitebuilderSite.files_dict,
-                                  desc='Modifying XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-                    
-                    site = SitebuilderSite.files_dict[journal]
-                    
-
-                    one_year = no_na_if_df[no_na_if_df['url_shortcode'] == site.journal_shortcode]['One year'].values
-                    five_year = no_na_if_df[no_na_if_df['url_shortcode'] == site.journal_shortcode]['Five year'].values
-
-                    
-                    ModifyFile.update_current_years_if(site, one_year[0], five_year[0])
-
-                for journal in tqdm(SitebuilderSite.files_dict,
-                                  desc='Posting XML files to Sitebuilder: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
+                    def work(site):
+                        impact_factors = data.records[site.journal_shortcode]
 
-                    site = SitebuilderSite.files_dict[journal]
+                        return 'if', {'one_year': impact_factors.one_year, 'five_year': impact_factors.five_year}
 
-                    try:
-                        count = 0
-                        while count < 5 & SitebuilderInteraction.post_xml(site) != 0:
-                            count += 1
-
-                    except Exception as e:
-                        tqdm.write(f'Unable to post XML: {site.journal_shortcode}: {e}')
+                    self.process_sites('if', sites, work)
             
             else:
                 self.quit()
@@ -273,99 +513,39 @@ class TerminalUI:
             self.confirm_data_file_structure()
             
             if input("Press \"q\" followed by enter to exit or any key to continue") != "q":
-                count = 0
-                exception_list = []
-                
-                rankings_df = pd.read_csv(join(self.current_dir, "data", "rankings.csv"))
+                data = self.load_supplementary_data('rankings')
                 
-                journal_shortcodes = []
-                [journal_shortcodes.append(x) for x in rankings_df['url_shortcode'] if x not in journal_shortcodes]
-                
-                for journal in tqdm(journal_shortcodes,
-                                  desc='Downloading XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-
-                    new_site = SitebuilderSite(journal, "rankings.txt")
-                    exception_list, count = SitebuilderInteraction.get_data(new_site, exception_list, count)
-
-                for i in trange(len(rankings_df['url_shortcode']),
-                                  desc='Modifying XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-                    
-                    site = SitebuilderSite.files_dict[rankings_df.iloc[i]['url_shortcode']]
-                    
-                    ranking_name = rankings_df.iloc[i]['Ranking Category']
-                    rank = rankings_df.iloc[i]['Ranking']
-
-                    
-                    ModifyFile.update_current_years_ranking(site, ranking_name, rank)
-
-                for journal in tqdm(SitebuilderSite.files_dict,
-                                  desc='Posting XML files to Sitebuilder: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
+                if data is not None:
+                    sites = [SitebuilderSite(journal, "rankings.txt") for journal in data.records]
 
-                    site = SitebuilderSite.files_dict[journal]
+                    def work(site):
+                        rankings = [(x.category, x.rank) for x in data.records[site.journal_shortcode]]
 
-                    try:
-                        count = 0
-                        while count < 5 & SitebuilderInteraction.post_xml(site) != 0:
-                            count += 1
+                        return 'rankings', {'rankings': rankings}
 
-                    except Exception as e:
-                        tqdm.write(f'Unable to post XML: {site.journal_shortcode}: {e}')
+                    self.process_sites('rankings', sites, work)
             
             else:
                 self.quit()
             
             break
     
-    def update_ppv():
+    def update_ppv(self):
         while True:
             self.confirm_data_file_structure()
             
             if input("Press \"q\" followed by enter to exit or any key to continue") != "q":
-                count = 0
-                exception_list = []
+                data = self.load_supplementary_data('ppv')
                 
-                ppv_df = pd.read_csv(join(self.current_dir, "data", "ppv.csv"))
-                
-                journal_shortcodes = []
-                [journal_shortcodes.append(x) for x in ppv_df['url_shortcode'] if x not in journal_shortcodes]
-                
-                for journal in tqdm(journal_shortcodes,
-                                  desc='Downloading XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-
-                    new_site = SitebuilderSite(journal, "data.xml")
-                    exception_list, count = SitebuilderInteraction.get_data(new_site, exception_list, count)
-
-                for i in trange(len(ppv_df['url_shortcode']),
-                                  desc='Modifying XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-                    
-                    site = SitebuilderSite.files_dict[ppv_df.iloc[i]['url_shortcode']]
-                    
-                    ModifyFile.update_ppv(site, ppv_df)
+                if data is not None:
+                    sites = [SitebuilderSite(journal, "data.xml") for journal in data.records]
 
-                for journal in tqdm(SitebuilderSite.files_dict,
-                                  desc='Posting XML files to Sitebuilder: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
+                    def work(site):
+                        prices = data.records[site.journal_shortcode]
 
-                    site = SitebuilderSite.files_dict[journal]
+                        return 'ppv', {'gbp': prices.gbp, 'eur': prices.eur, 'usd': prices.usd}
 
-                    try:
-                        count = 0
-                        while count < 5 & SitebuilderInteraction.post_xml(site) != 0:
-                            count += 1
-
-                    except Exception as e:
-                        tqdm.write(f'Unable to post XML: {site.journal_shortcode}: {e}')
+                    self.process_sites('ppv', sites, work)
             
             else:
                 self.quit()
@@ -377,45 +557,16 @@ class TerminalUI:
             self.confirm_data_file_structure()
             
             if input("Press \"q\" followed by enter to exit or any key to continue") != "q":
-                count = 0
-                exception_list = []
-                
-                trendmd_df = pd.read_csv(join(self.current_dir, "data", "trendmd.csv"))
+                data = self.load_supplementary_data('trendmd')
                 
-                journal_shortcodes = []
-                [journal_shortcodes.append(x) for x in ppv_df['url_shortcode'] if x not in journal_shortcodes]
-                
-                for journal in tqdm(journal_shortcodes,
-                                  desc='Downloading XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-
-                    new_site = SitebuilderSite(journal, "data.xml")
-                    exception_list, count = SitebuilderInteraction.get_data(new_site, exception_list, count)
-
-                for i in trange(len(trendmd_df['url_shortcode']),
-                                  desc='Modifying XML files: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-                    
-                    site = SitebuilderSite.files_dict[trendmd_df.iloc[i]['url_shortcode']]
-                    
-                    ModifyFile.update_ppv(site, trendmd_df[trendmd_df['url_shortcode'] == site.journal_shortcode]['id'])
-
-                for journal in tqdm(SitebuilderSite.files_dict,
-                                  desc='Posting XML files to Sitebuilder: ',
-                                  position=0, leave=True,
-                                  file = sys.stdout):
-
-                    site = SitebuilderSite.files_dict[journal]
+                if data is not None:
+                    # TrendMD widgets are added to the right rail in the config
+                    sites = [SitebuilderSite(journal, "config.xml") for journal in data.records]
 
-                    try:
-                        count = 0
-                        while count < 5 & SitebuilderInteraction.post_xml(site) != 0:
-                            count += 1
+                    def work(site):
+                        return 'trendmd', {'trendmd_id': data.records[site.journal_shortcode].trendmd_id}
 
-                    except Exception as e:
-                        tqdm.write(f'Unable to post XML: {site.journal_shortcode}: {e}')
+                    self.process_sites('trendmd', sites, work)
             
             else:
                 self.quit()
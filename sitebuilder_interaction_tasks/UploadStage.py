@@ -0,0 +1,53 @@
+from random import uniform
+from time import perf_counter, sleep
+
+from tqdm import tqdm
+
+from sitebuilder_interaction_tasks.ConcurrentStage import ConcurrentStage
+from sitebuilder_interaction_tasks.SitebuilderInteraction import SitebuilderInteraction
+
+class UploadStage(ConcurrentStage):
+    '''
+    Upload each site's modified file, retrying retryable failures with exponential backoff.
+    '''
+
+    stage = 'upload'
+    desc = 'Posting XML files to Sitebuilder: '
+
+    # Retry budget for each site, including the first attempt
+    max_attempts = 5
+
+    # Seconds; the delay before retry n is drawn from 0 to base_delay * 2 ** (n - 1), up to max_delay
+    base_delay = 2
+    max_delay = 60
+
+    def backoff_delay(self, attempt):
+        return uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def process(self, site):
+        start = perf_counter()
+        attempt = 1
+
+        while True:
+            result = SitebuilderInteraction.post_xml(site)
+
+            if result.ok or not result.retryable or attempt >= self.max_attempts:
+                break
+
+            delay = self.backoff_delay(attempt)
+            tqdm.write(f'{site.journal_shortcode}: upload attempt {attempt} failed ({result.error}), '
+                       f'retrying in {delay:.1f}s')
+            sleep(delay)
+            attempt += 1
+
+        result.attempts = attempt
+        result.latency = perf_counter() - start
+
+        return result
+
+    def summarise(self, results):
+        super().summarise(results)
+
+        for result in results:
+            tqdm.write(f'{result.journal_shortcode}: {result.status}, {result.attempts} attempt(s), '
+                       f'{result.latency:.1f}s')
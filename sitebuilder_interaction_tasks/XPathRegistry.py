@@ -0,0 +1,61 @@
+from lxml import etree as et
+
+class XPathRegistry:
+    '''
+    XPath queries used to modify the Sitebuilder files, compiled once at import.
+
+    Values that change from call to call, e.g. a ranking name or year, are passed as XPath
+    variables rather than formatted into the expression, so the queries are never recompiled
+    and values containing quotes cannot break them.
+
+    Lookups that only need the first match are ElementPath paths for first, as find stops at
+    the first match where an XPath query collects every match; lxml caches the compiled paths.
+    '''
+
+    # Shared parser for the downloaded files; umbrella config files can exceed libxml2's default
+    # size limits, and nothing in them needs id collection, entity resolution or network access
+    parser = et.XMLParser(huge_tree=True, collect_ids=False, resolve_entities=False, no_network=True)
+
+    # Top level widget locations, see ModifyFile.add_top_level_widget_xml
+    main_content_block = et.XPath('//Location[@name="MainContent"]/Block')
+    home_page = et.XPath('//Page[@name="Home"]')
+    page_settings = et.XPath('//PageSettings')
+    site_template_settings = et.XPath('//SiteTemplateSettings')
+    widget_settings = et.XPath('//WidgetSettings')
+
+    # TrendMD widget
+    right_rail_block = et.XPath(".//*[@name='RightRail']/Block")
+    related_content = ".//*[@type='RelatedContent']"
+    related_pubmed = ".//*[@type='RelatedPubMed']"
+    trendmd_block_widget = ".//Block/*[@type='TrendMD']"
+    trendmd_widget_setting = ".//WidgetSettings/*[@type='TrendMD']"
+
+    # ACL widgets
+    widget_setting_named = et.XPath(".//WidgetSettings/*[@instanceName=$name]")
+
+    # Rankings
+    current_ranks = et.XPath(".//rank[@current='true']")
+
+    # Impact factors
+    current_impact_factors = et.XPath(".//ImpactFactor[@current='true']")
+    impact_factors = et.XPath(".//ImpactFactors")
+    impact_factors_for_year = et.XPath(".//ImpactFactor[@year=$year]")
+
+    # PPV
+    prices = ".//Prices"
+    price = et.XPath("Price")
+
+    @staticmethod
+    def ranks_for_year(category, year):
+        '''
+        The category's own ranks for the year. It has only a few children, which are quicker to
+        check directly than through an XPath query.
+        '''
+        return [x for x in category.iterchildren('rank') if x.get('year') == year]
+
+    @staticmethod
+    def first(path, element):
+        '''
+        The first match for one of the ElementPath paths above in document order, or None.
+        '''
+        return element.find(path)